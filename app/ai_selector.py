@@ -1,37 +1,100 @@
 """Deterministic AI code selection with root family validation."""
 
-from typing import List, Dict, Set
-from openai import AsyncOpenAI
+from collections import Counter
+from operator import itemgetter
+from typing import List, Dict, Set, Tuple
+from pydantic import ValidationError
+import simple_icd_10_cm as icd_lib
 from .models import InitialSelectionResponse
-from .prompts import CODE_SELECTION_PROMPT
-from .config import OPENAI_API_KEY
-import json
+from .prompts import CODE_SELECTION_SYSTEM_PROMPT, CODE_SELECTION_PROMPT
+from .config import OPENAI_ASYNC_CLIENT
+from .openai_retry import with_backoff
+from .openai_batch import run_chat_batch
+from .llm_cache import cached_completion, make_cache_key
+import asyncio
+import hashlib
 import logging
+import os
+import re
 
 # Configure professional logging
 logger = logging.getLogger(__name__)
 
+# Return tiny shortlists without a model call; off by default since the model may still reject them
+ENABLE_SELECTION_SHORTCUT = os.getenv("ENABLE_SELECTION_SHORTCUT") == "1"
+
+# Title punctuation normalization for candidate ordering: drop commas and periods, hyphens become spaces
+_TITLE_PUNCTUATION = str.maketrans({',': None, '.': None, '-': ' '})
+
+# Request constants, built once at import so each call only allocates its user message
+_SYSTEM_MESSAGE = {"role": "system", "content": CODE_SELECTION_SYSTEM_PROMPT}
+_SELECTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "code_selection",
+        "strict": True,
+        "schema": InitialSelectionResponse.model_json_schema()
+    }
+}
+
 class AICodeSelector:
     """Deterministic AI selector with root family focus validation."""
     
-    MODEL = "gpt-4o-2024-08-06"
+    MODEL = "gpt-4o-mini-2024-07-18"  # Schema-bounded shortlisting does not need the full model
     TEMPERATURE = 0.0
     SEED = 42
     MAX_ROOT_FAMILIES = 6
-    PRIMARY_FAMILY_THRESHOLD = 0.8
+    MAX_CANDIDATES_TO_AI = 60  # Top-ranked candidates sent to the model; at least the schema's max_items selection size
+    RESPONSE_CACHE_TTL = 24 * 3600  # Seconds a persisted selection response stays valid
+    SKIP_SELECTION_THRESHOLD = 2  # Shortlists this small skip the model when ENABLE_SELECTION_SHORTCUT is set
+    MAX_SELECTION_TOKENS = 700  # Output cap per document: up to 60 quoted codes at ~10 tokens each plus JSON framing
     
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, max_async: int = 8, model: str = MODEL):
+        """
+        Args:
+            max_async: Maximum number of concurrent selection calls in select_many,
+                sized to the OpenAI tier rate limit
+            model: OpenAI model used for selection (override for A/B comparison)
+        """
+        self.client = OPENAI_ASYNC_CLIENT
+        self.max_async = max_async
+        self.model = model
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     async def select_relevant_codes(self, medical_text: str, candidates: List[Dict]) -> List[str]:
-        """Select relevant codes with deterministic root family validation."""
+        """Select relevant codes, sharing one in-flight call between identical concurrent inputs.
+        
+        Completed responses are reused through the LLMCache (memory tier, then
+        SQLite); this only coalesces calls that start before the first one finishes.
+        """
         
         if not candidates:
             logger.warning("No candidate codes provided for selection")
             return []
         
-        # Smart ordering by prefix and keyword relevance
-        ordered_candidates = self._smart_candidate_ordering(candidates, medical_text)
+        cache_key = self._selection_cache_key(medical_text, candidates)
+        
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._select_uncached(medical_text, candidates))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        else:
+            logger.info("Joining in-flight selection for identical input")
+        
+        validated_codes = await asyncio.shield(task)
+        
+        return list(validated_codes)
+    
+    async def _select_uncached(self, medical_text: str, candidates: List[Dict]) -> List[str]:
+        """Select relevant codes with deterministic root family validation."""
+        
+        # Smart ordering by prefix and keyword relevance, keeping only the top-ranked candidates
+        ordered_candidates = self._shortlist_candidates(candidates, medical_text)
+        
+        if ENABLE_SELECTION_SHORTCUT and len(ordered_candidates) <= self.SKIP_SELECTION_THRESHOLD:
+            logger.info(f"Shortlist has {len(ordered_candidates)} candidates, skipping AI selection")
+            return self._validate_root_family_focus([c['icd_code'] for c in ordered_candidates])
         
         # Format candidates for AI processing
         formatted_candidates = self._format_candidates_for_ai(ordered_candidates)
@@ -49,38 +112,96 @@ class AICodeSelector:
         
         logger.info(f"Code selection complete: {len(validated_codes)} codes from {len(self._get_root_families(validated_codes))} families")
         return validated_codes
-
     
-    async def _execute_ai_selection(self, medical_text: str, formatted_candidates: str, candidates: List[Dict] = None) -> List[str]:
-        """Execute AI selection with strict deterministic parameters."""
+    async def select_many(self, jobs: List[Tuple[str, List[Dict]]]) -> List[List[str]]:
+        """Select codes for several documents concurrently, bounded by max_async in-flight calls."""
+        
+        semaphore = asyncio.Semaphore(self.max_async)
+        
+        async def _bounded(medical_text: str, candidates: List[Dict]) -> List[str]:
+            async with semaphore:
+                return await self.select_relevant_codes(medical_text, candidates)
+        
+        logger.info(f"Running selection for {len(jobs)} documents (max concurrency: {self.max_async})")
+        return list(await asyncio.gather(*[_bounded(text, candidates) for text, candidates in jobs]))
+    
+    async def select_relevant_codes_batch(self, jobs: List[Tuple[str, List[Dict]]]) -> List[List[str]]:
+        """Select codes for many documents through a single OpenAI Batch API job.
+        
+        Intended for bulk ingestion where latency is not a concern; results are
+        returned in the same order as ``jobs``. Interactive callers should keep
+        using ``select_relevant_codes``.
+        """
+        results: List[List[str]] = [[] for _ in jobs]
+        
+        bodies = {}
+        for index, (medical_text, candidates) in enumerate(jobs):
+            if not candidates:
+                logger.warning(f"Batch job {index}: no candidate codes provided for selection")
+                continue
+            
+            ordered_candidates = self._shortlist_candidates(candidates, medical_text)
+            formatted_candidates = self._format_candidates_for_ai(ordered_candidates)
+            bodies[f"selection-{index}"] = self._build_selection_request(medical_text, formatted_candidates)
+        
+        if not bodies:
+            return results
+        
+        try:
+            contents = await run_chat_batch(self.client, bodies, "code_selection")
+        except Exception as e:
+            logger.error(f"Batch AI selection failed: {e}")
+            return results
+        
+        for custom_id, content in contents.items():
+            try:
+                selection_result = InitialSelectionResponse.model_validate_json(content)
+            except ValueError as e:
+                logger.warning(f"Skipping unparseable batch result {custom_id}: {e}")
+                continue
+            
+            index = int(custom_id.rsplit("-", 1)[1])
+            results[index] = self._validate_root_family_focus(selection_result.selected_codes)
+        
+        logger.info(f"Batch selection complete: {sum(1 for codes in results if codes)}/{len(jobs)} jobs returned codes")
+        return results
+    
+    def _build_selection_request(self, medical_text: str, formatted_candidates: str) -> Dict:
+        """Build the chat completion request body shared by the interactive and batch paths."""
         
         prompt = CODE_SELECTION_PROMPT.format(
             medical_text=medical_text,
             candidate_codes=formatted_candidates
         )
         
+        # Requests sharing a candidate block share a cacheable prefix; route them together
+        prompt_cache_key = hashlib.blake2b(formatted_candidates.encode(), digest_size=8).hexdigest()
+        
+        return {
+            "model": self.model,
+            "messages": [
+                _SYSTEM_MESSAGE,
+                {"role": "user", "content": prompt}
+            ],
+            "response_format": _SELECTION_RESPONSE_FORMAT,
+            "temperature": self.TEMPERATURE,
+            "top_p": 1.0,
+            "seed": self.SEED,
+            "max_tokens": self.MAX_SELECTION_TOKENS,
+            "prompt_cache_key": f"code-selection-{prompt_cache_key}"
+        }
+    
+    async def _execute_ai_selection(self, medical_text: str, formatted_candidates: str, candidates: List[Dict] = None) -> List[str]:
+        """Execute AI selection with strict deterministic parameters."""
+        
         try:
-            response = await self.client.chat.completions.create(
-                model=self.MODEL,
-                messages=[
-                    {"role": "system", "content": "You are a medical coding expert performing precise root family-focused code selection."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "code_selection",
-                        "strict": True,
-                        "schema": InitialSelectionResponse.model_json_schema()
-                    }
-                },
-                temperature=self.TEMPERATURE,
-                top_p=1.0,
-                seed=self.SEED
+            request = self._build_selection_request(medical_text, formatted_candidates)
+            content = await cached_completion(
+                make_cache_key(request),
+                self.RESPONSE_CACHE_TTL,
+                lambda: self._stream_selection(request)
             )
-            
-            result_json = json.loads(response.choices[0].message.content)
-            selection_result = InitialSelectionResponse(**result_json)
+            selection_result = InitialSelectionResponse.model_validate_json(content)
             
             logger.info(f"AI selected {len(selection_result.selected_codes)} codes for validation")
             return selection_result.selected_codes
@@ -89,23 +210,71 @@ class AICodeSelector:
             logger.error(f"AI selection failed: {e}")
             return []
     
+    def _selection_cache_key(self, medical_text: str, candidates: List[Dict]) -> str:
+        """Hash the normalized selection inputs into an in-flight key."""
+        candidate_codes = '|'.join(sorted(c['icd_code'] for c in candidates))
+        payload = medical_text.strip().encode() + b'|' + candidate_codes.encode()
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+    
+    async def _stream_selection(self, request: Dict) -> str:
+        """Stream the selection response and return its raw content as soon as the buffered JSON validates.
+        
+        Opening and consuming the stream run as one retried operation under the shared
+        concurrency limit, so open streams are bounded and a dropped stream starts over.
+        """
+        return await with_backoff(lambda: self._consume_selection_stream(request))
+    
+    async def _consume_selection_stream(self, request: Dict) -> str:
+        """Open one selection stream and read it until the buffered JSON validates."""
+        stream = await self.client.chat.completions.create(**request, stream=True)
+        buffer = []
+        
+        try:
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                delta = chunk.choices[0].delta.content
+                buffer.append(delta)
+                
+                # The response object can only be complete once a closing brace arrives
+                if '}' in delta:
+                    content = ''.join(buffer)
+                    try:
+                        InitialSelectionResponse.model_validate_json(content)
+                        return content
+                    except ValidationError:
+                        continue
+        finally:
+            await stream.close()
+        
+        # Raises on an incomplete response so it is never cached
+        content = ''.join(buffer)
+        InitialSelectionResponse.model_validate_json(content)
+        return content
+    
     def _validate_root_family_focus(self, selected_codes: List[str]) -> List[str]:
         """Validate and enforce 1-2 root family focus requirement."""
         
         if not selected_codes:
             return []
         
+        # Fast path: the model already honored the family limit, nothing to filter
+        families = {code[:3] for code in selected_codes}
+        if len(families) <= self.MAX_ROOT_FAMILIES:
+            logger.info(f"Root family validation - {len(families)} families within limit of {self.MAX_ROOT_FAMILIES}")
+            return list(selected_codes)
+        
         # Analyze root family distribution
         family_distribution = self._analyze_root_family_distribution(selected_codes)
         
-        # Sort families by code count (descending)
-        sorted_families = sorted(family_distribution.items(), key=lambda x: x[1], reverse=True)
+        # Top families by code count (descending); most_common(n) is a heap-based top-k, not a full sort
+        sorted_families = family_distribution.most_common(self.MAX_ROOT_FAMILIES)
         
         # Enforce maximum 2 families rule
-        allowed_families = set([family[0] for family in sorted_families[:self.MAX_ROOT_FAMILIES]])
+        allowed_families = {family for family, _ in sorted_families}
         
         # Filter codes to allowed families
-        validated_codes = [code for code in selected_codes if self._extract_root_family(code) in allowed_families]
+        validated_codes = [code for code in selected_codes if code[:3] in allowed_families]
         
         # Log validation results
         primary_family = sorted_families[0][0] if sorted_families else "None"
@@ -123,41 +292,74 @@ class AICodeSelector:
         return validated_codes
 
     
-    def _analyze_root_family_distribution(self, codes: List[str]) -> Dict[str, int]:
+    def _analyze_root_family_distribution(self, codes: List[str]) -> Counter:
         """Analyze distribution of codes across root families."""
-        family_counts = {}
-        for code in codes:
-            root_family = self._extract_root_family(code)
-            family_counts[root_family] = family_counts.get(root_family, 0) + 1
-        return family_counts
-    
-    def _extract_root_family(self, code: str) -> str:
-        """Extract root family (first 3 characters) from ICD code."""
-        return code[:3] if len(code) >= 3 else code
+        return Counter(code[:3] for code in codes)
     
     def _get_root_families(self, codes: List[str]) -> Set[str]:
         """Get unique root families from code list."""
-        return set([self._extract_root_family(code) for code in codes])
+        return {code[:3] for code in codes}
     
     def _is_root_code(self, code: str) -> bool:
         """Check if code is a root code (3 characters without decimal)."""
         return len(code) == 3 and code.isalnum()
     
+    def _shortlist_candidates(self, candidates: List[Dict], medical_text: str) -> List[Dict]:
+        """Order candidates by relevance and keep the top MAX_CANDIDATES_TO_AI for the prompt."""
+        
+        # Duplicate codes (e.g. merged result sets from several searches) only repeat prompt tokens
+        unique_candidates = self._dedup_candidates(candidates)
+        if len(unique_candidates) < len(candidates):
+            logger.info(f"Removed {len(candidates) - len(unique_candidates)} duplicate candidates before AI selection")
+        
+        # Root codes without children are always dropped after hierarchy completion and
+        # contribute no descendants, so the model should never spend tokens on them.
+        # get_children raises on unknown codes; those pass through for hierarchy completion to report
+        prefiltered = [
+            c for c in unique_candidates
+            if not self._is_root_code(c['icd_code'])
+            or not icd_lib.is_valid_item(c['icd_code'])
+            or icd_lib.get_children(c['icd_code'])
+        ]
+        if len(prefiltered) < len(unique_candidates):
+            logger.info(f"Removed {len(unique_candidates) - len(prefiltered)} childless root codes before AI selection")
+        
+        ordered_candidates = self._smart_candidate_ordering(prefiltered, medical_text)
+        
+        dropped_count = len(ordered_candidates) - self.MAX_CANDIDATES_TO_AI
+        if dropped_count > 0:
+            logger.info(f"Dropped {dropped_count} lower-ranked candidates before AI selection")
+        
+        return ordered_candidates[:self.MAX_CANDIDATES_TO_AI]
+    
+    def _dedup_candidates(self, candidates: List[Dict]) -> List[Dict]:
+        """Drop repeated ICD codes, keeping the first occurrence of each."""
+        # setdefault probes the dict once per candidate and keeps insertion order
+        unique: Dict[str, Dict] = {}
+        for candidate in candidates:
+            unique.setdefault(candidate['icd_code'], candidate)
+        return list(unique.values())
+    
     def _smart_candidate_ordering(self, candidates: List[Dict], medical_text: str) -> List[Dict]:
         """Order candidates by relevance: prefix match between title keywords and code descriptions."""
         
         # Clean title: case insensitive, remove punctuation, handle multi-word intelligently
-        title_clean = medical_text.lower().strip()
-        title_clean = title_clean.replace(',', '').replace('.', '').replace('-', ' ')
+        title_clean = medical_text.lower().strip().translate(_TITLE_PUNCTUATION)
         
         # Extract main medical term (first meaningful word if multi-word)
         title_words = [word for word in title_clean.split() if len(word) > 3]
         primary_term = title_words[0] if title_words else title_clean
         
-        def calculate_relevance_score(candidate):
-            code = candidate['icd_code']
-            description = candidate['description'].lower()
-            
+        # Match all additional title words in a single regex pass per description.
+        # The lookahead finds the longest word at every position; shorter words
+        # starting at the same position are recovered as prefixes of that match.
+        additional_counts = Counter(title_words[1:])
+        additional_pattern = None
+        if additional_counts:
+            alternation = '|'.join(map(re.escape, sorted(additional_counts, key=len, reverse=True)))
+            additional_pattern = re.compile(f'(?=({alternation}))')
+        
+        def calculate_relevance_score(code: str, description: str, score: float):
             # Calculate prefix matches using primary medical term
             prefix_score = 0
             if len(primary_term) >= 4:
@@ -173,49 +375,53 @@ class AICodeSelector:
             keyword_score = 0
             if primary_term in description:
                 keyword_score += 3  # Exact primary term match
-            if len(title_words) > 1:
+            if additional_pattern is not None:
                 # Multi-word titles: bonus for additional word matches
-                additional_matches = sum(1 for word in title_words[1:] if word in description)
-                keyword_score += additional_matches
+                matched_words = {
+                    match[:length]
+                    for match in set(additional_pattern.findall(description))
+                    for length in range(4, len(match) + 1)
+                    if match[:length] in additional_counts
+                }
+                keyword_score += sum(additional_counts[word] for word in matched_words)
             
-            # Return tuple for sorting (higher scores first, then alphabetical)
-            return (-prefix_score, -keyword_score, code)
+            # Return tuple for sorting (higher scores first, ties by vector similarity, then alphabetical)
+            return (-prefix_score, -keyword_score, -score, code)
+        
+        # Score every candidate exactly once; descriptions are lowered locally so the
+        # caller's candidate dicts (shared with caches and other selections) stay untouched
+        scored = [
+            (
+                calculate_relevance_score(
+                    candidate['icd_code'], candidate['description'].lower(), candidate.get('score', 0.0)
+                ),
+                candidate
+            )
+            for candidate in candidates
+        ]
         
-        sorted_candidates = sorted(candidates, key=calculate_relevance_score)
+        scored.sort(key=itemgetter(0))
+        sorted_candidates = [candidate for _, candidate in scored]
         
-        # Log the reordering for debugging
-        if len(sorted_candidates) >= 10:
-            title_preview = medical_text.split()[0] if medical_text.split() else "Unknown"
-            logger.info(f"Smart ordering for title '{title_preview}' - Top candidates:")
-            for i, candidate in enumerate(sorted_candidates[:20]):
-                logger.info(f"  {i+1}. {candidate['icd_code']} - {candidate['description'][:50]}...")
+        # Log the reordering for debugging (skipped entirely when INFO is disabled)
+        if len(sorted_candidates) >= 10 and logger.isEnabledFor(logging.INFO):
+            title_preview = medical_text.split(maxsplit=1)[0] if medical_text.strip() else "Unknown"
+            logger.info("Smart ordering for title '%s' - Top candidates:", title_preview)
+            for i, candidate in enumerate(sorted_candidates[:20], start=1):
+                logger.info("  %d. %s - %.50s...", i, candidate['icd_code'], candidate['description'])
         
         return sorted_candidates
     
     def _format_candidates_for_ai(self, candidates: List[Dict]) -> str:
-        """Format candidates with rich clinical context for enhanced AI accuracy."""
-        formatted_lines = []
-        for candidate in candidates:
-            # Build structured format with clinical context
-            parts = [f"Code: {candidate['icd_code']}"]
-            
-            # Make descriptions more appealing by replacing negative language
-            description = candidate['description']
+        """Format candidates with rich clinical context for enhanced AI accuracy.
         
-            
-            parts.append(f"Description: {description}")
-            
-            # Add rich clinical context if available
-            if candidate.get('rich_text'):
-                parts.append(f"Clinical Context: {candidate['rich_text'][:200]}...")
-            
-            # Add classification context
-            if candidate.get('chapter'):
-                parts.append(f"Chapter: {candidate['chapter']}")
-            if candidate.get('section'):
-                parts.append(f"Section: {candidate['section']}")
-            
-            # Format as structured block
-            formatted_lines.append(" | ".join(parts))
-            
-        return "\n".join(formatted_lines) 
\ No newline at end of file
+        Candidates keep their relevance order, so the model reads the best matches first.
+        """
+        # One string per candidate: structured code block with clinical and classification context
+        return "\n".join(
+            f"Code: {c['icd_code']} | Description: {c['description']}"
+            + (f" | Clinical Context: {c['rich_text_short']}..." if c.get('rich_text_short') else "")
+            + (f" | Chapter: {c['chapter']}" if c.get('chapter') else "")
+            + (f" | Section: {c['section']}" if c.get('section') else "")
+            for c in candidates
+        ) 
\ No newline at end of file
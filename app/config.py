@@ -1,7 +1,10 @@
 """Configuration with environment validation."""
 
+import asyncio
 import os
+import httpx
 from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI
 
 load_dotenv()
 
@@ -17,5 +20,37 @@ if not all(required_vars):
                if not os.getenv(var)]
     raise RuntimeError(f"Missing required environment variables: {missing}")
 
+# Shared async OpenAI client - one connection pool and TLS session for every async caller
+OPENAI_ASYNC_CLIENT = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=200),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+)
+
+# Shared sync OpenAI client for blocking callers (embeddings, metadata generation)
+OPENAI_CLIENT = OpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+)
+
+# Caps in-flight OpenAI requests across all async callers; match to the account tier limit
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "64"))
+OPENAI_SEMAPHORE = asyncio.Semaphore(OPENAI_CONCURRENCY)
+
+# Worker threads for blocking calls (text extraction, embeddings, Pinecone, cache I/O) run via asyncio.to_thread
+THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", "32"))
+
+
+async def close_openai_clients() -> None:
+    """Close the shared OpenAI connection pools on shutdown."""
+    await OPENAI_ASYNC_CLIENT.close()
+    OPENAI_CLIENT.close()
+
 # ICD Configuration (hardcoded in medical_engine.py)
 # Processing Configuration (hardcoded in respective classes) 
\ No newline at end of file
@@ -5,32 +5,59 @@ This module provides functionality to extract and generate CPT codes from medica
 using OpenAI's GPT models.
 """
 
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from .config import OPENAI_API_KEY
+from typing import List, Dict, Any, Optional, Tuple
+from .config import OPENAI_ASYNC_CLIENT
+from .openai_retry import create_with_backoff
+from .openai_batch import run_chat_batch
+from .llm_cache import cached_completion, make_cache_key
+from .models import CPTCodeList
+from .prompts import CPT_GENERATION_PROMPT
+from .token_limits import get_encoding, truncate_to_tokens
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+_SYSTEM_MESSAGE = {"role": "system", "content": "You are a medical coding assistant that extracts CPT codes from medical documents."}
+_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "cpt_codes",
+        "strict": True,
+        "schema": CPTCodeList.model_json_schema()
+    }
+}
+
+
 class CPTGenerator:
     """
     A class to handle CPT code generation from medical documents.
     Uses OpenAI's GPT models to analyze text and extract relevant procedure codes.
     """
     
-    def __init__(self, model: str = "gpt-4-turbo"):
+    LIGHT_MODEL = "gpt-4o-mini"  # Tried first for short documents; Low-confidence answers escalate to the full model
+    LIGHT_MODEL_MAX_CHARS = 1500
+    TOKEN_ENCODING = "o200k_base"  # Tokenizer used by gpt-4o models
+    MAX_DOCUMENT_TOKENS = 3500
+    MAX_DOCUMENT_CHARS = 10000  # Fallback cap when no tokenizer is available
+    RESPONSE_CACHE_TTL = 24 * 3600  # Seconds a persisted generation response stays valid
+    
+    def __init__(self, model: str = "gpt-4o-2024-08-06"):
         """
         Initialize the CPT generator with the specified OpenAI model.
         
         Args:
-            model: The OpenAI model to use for generation (default: gpt-4-turbo)
+            model: The OpenAI model to use for generation; must support structured outputs
+                (default: gpt-4o-2024-08-06)
         """
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = OPENAI_ASYNC_CLIENT
         self.model = model
+        # Load the tokenizer now (built off the event loop at startup) rather than on the first request
+        get_encoding(self.TOKEN_ENCODING)
         logger.info(f"Initialized CPT Generator with model: {model}")
     
-    def generate_cpt_codes(
+    async def generate_cpt_codes(
         self, 
         document_text: str,
         max_codes: int = 5
@@ -46,110 +73,147 @@ class CPTGenerator:
             List of dictionaries containing CPT codes and their details
         """
         try:
-            # Prepare the prompt for the AI model
-            prompt = self._prepare_prompt(document_text, max_codes)
-            
-            # Call the OpenAI API (synchronous call)
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a medical coding assistant that extracts CPT codes from medical documents."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                max_tokens=1000
-            )
-            
-            # Parse the response
-            result = response.choices[0].message.content
-            cpt_codes = self._parse_response(result)
+            request = self._build_request(document_text, max_codes)
+            cpt_codes = await self._complete(request, max_codes)
             
-            # Validate and format the codes
-            validated_codes = self._validate_cpt_codes(cpt_codes)
+            # Answers the light model is unsure of are retried once on the full model
+            if request["model"] == self.LIGHT_MODEL and self._needs_escalation(cpt_codes):
+                logger.info(f"Escalating CPT generation from {request['model']} to {self.model}")
+                cpt_codes = await self._complete({**request, "model": self.model}, max_codes)
             
-            return validated_codes[:max_codes]
+            return cpt_codes
             
         except Exception as e:
             logger.error(f"Error generating CPT codes: {str(e)}", exc_info=True)
             return []
     
-    def _prepare_prompt(self, document_text: str, max_codes: int) -> str:
-        """Prepare the prompt for the AI model."""
-        return f"""
-        Analyze the following medical document and extract up to {max_codes} relevant CPT codes.
-        For each code, provide:
-        1. The CPT code
-        2. A brief description
-        3. The confidence level (Low, Medium, High)
-        4. The relevant text from the document that supports this code
-        
-        Format your response as a list of JSON objects with the following structure:
-        [
-            {{
-                "code": "CPT_CODE",
-                "description": "Procedure description",
-                "confidence": "High/Medium/Low",
-                "supporting_text": "Relevant text from the document"
-            }}
-        ]
-        
-        Document Text:
-        {document_text[:10000]}  # Limit to first 10k chars to avoid token limits
+    async def generate_cpt_codes_batch(
+        self,
+        document_texts: List[str],
+        max_codes: int = 5,
+        concurrency: int = 20
+    ) -> List[List[Dict[str, Any]]]:
         """
-    
-    def _parse_response(self, response_text: str) -> List[Dict[str, Any]]:
-        """Parse the AI model's response into a list of CPT codes."""
-        import json
-        import re
+        Generate CPT codes for several documents concurrently.
         
-        try:
-            # Try to parse the response as JSON
-            return json.loads(response_text)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, try to extract JSON-like structures using regex
-            json_matches = re.findall(r'\[\s*\{.*\}\s*\]', response_text, re.DOTALL)
-            if json_matches:
-                try:
-                    return json.loads(json_matches[0])
-                except json.JSONDecodeError:
-                    logger.warning("Failed to parse JSON from response")
+        Args:
+            document_texts: Text content of each medical document
+            max_codes: Maximum number of CPT codes to return per document
+            concurrency: Maximum number of in-flight generation calls
             
-            # If all else fails, return an empty list
-            return []
+        Returns:
+            One list of CPT code dictionaries per document, in input order
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def _bounded(document_text: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.generate_cpt_codes(document_text, max_codes)
+        
+        logger.info(f"Generating CPT codes for {len(document_texts)} documents (max concurrency: {concurrency})")
+        return list(await asyncio.gather(*[_bounded(text) for text in document_texts]))
     
-    def _validate_cpt_codes(self, codes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def generate_cpt_codes_offline(
+        self,
+        document_texts: List[str],
+        max_codes: int = 5
+    ) -> List[List[Dict[str, Any]]]:
         """
-        Validate the format of CPT codes and add any missing fields.
+        Generate CPT codes for many documents through a single OpenAI Batch API job.
+        
+        Batch jobs are billed at half price but can take up to 24 hours, so this
+        is intended for bulk back-coding; interactive callers should keep using
+        generate_cpt_codes.
         
         Args:
-            codes: List of code dictionaries to validate
+            document_texts: Text content of each medical document
+            max_codes: Maximum number of CPT codes to return per document
             
         Returns:
-            List of validated code dictionaries
+            One list of CPT code dictionaries per document, in input order
+            (empty for documents whose request failed)
         """
-        validated = []
-        
-        for code in codes:
-            if not isinstance(code, dict):
-                continue
-                
-            # Ensure required fields exist
-            code.setdefault('code', '')
-            code.setdefault('description', '')
-            code.setdefault('confidence', 'Medium')
-            code.setdefault('supporting_text', '')
-            
-            # Clean the code (remove non-alphanumeric characters)
-            if 'code' in code and code['code']:
-                code['code'] = ''.join(c for c in str(code['code']) if c.isalnum())
-            
-            # Validate confidence level
-            if 'confidence' in code and code['confidence'] not in ['High', 'Medium', 'Low']:
-                code['confidence'] = 'Medium'
-            
-            validated.append(code)
+        results: List[List[Dict[str, Any]]] = [[] for _ in document_texts]
+        bodies = {
+            f"cpt-{index}": self._build_request(document_text, max_codes)
+            for index, document_text in enumerate(document_texts)
+        }
+        
+        try:
+            contents = await run_chat_batch(self.client, bodies, "cpt_generation")
+        except Exception as e:
+            logger.error(f"Batch CPT generation failed: {str(e)}", exc_info=True)
+            return results
+        
+        for custom_id, content in contents.items():
+            try:
+                results[int(custom_id.rsplit("-", 1)[1])] = self._format_codes(content, max_codes)
+            except ValueError as e:
+                logger.warning(f"Skipping unparseable CPT batch result {custom_id}: {e}")
+        
+        logger.info(f"Batch CPT generation complete: {sum(1 for codes in results if codes)}/{len(document_texts)} documents returned codes")
+        return results
+    
+    async def _complete(self, request: Dict[str, Any], max_codes: int) -> List[Dict[str, Any]]:
+        """Run a generation request and return its structured codes as dictionaries."""
+        async def _create() -> str:
+            response = await create_with_backoff(self.client, request)
+            content = response.choices[0].message.content
+            # Raises on truncated output so it is never cached
+            CPTCodeList.model_validate_json(content)
+            return content
+        
+        # Call the OpenAI API without blocking the event loop; exact repeats are served from the response cache
+        result = await cached_completion(make_cache_key(request), self.RESPONSE_CACHE_TTL, _create)
+        
+        return self._format_codes(result, max_codes)
+    
+    def _needs_escalation(self, codes: List[Dict[str, Any]]) -> bool:
+        """Whether a light-model answer is too uncertain to return: any Low-confidence code.
+        
+        An empty answer is returned as is; most short patient-education documents describe no procedures.
+        """
+        return any(code['confidence'] == 'Low' for code in codes)
+    
+    def _build_request(self, document_text: str, max_codes: int) -> Dict[str, Any]:
+        """Build the chat completion request body shared by the interactive and batch paths."""
+        # Short documents are routed to the cheaper, faster model
+        model = self.LIGHT_MODEL if len(document_text) < self.LIGHT_MODEL_MAX_CHARS else self.model
+        
+        prompt, document_tokens = self._prepare_prompt(document_text, max_codes)
+        if document_tokens is not None:
+            logger.debug(f"CPT prompt built with {document_tokens} document tokens for {model}")
         
-        return validated
+        return {
+            "model": model,
+            "messages": [
+                _SYSTEM_MESSAGE,
+                {"role": "user", "content": prompt}
+            ],
+            "response_format": _RESPONSE_FORMAT,
+            "temperature": 0.2,
+            "max_tokens": 1000
+        }
+    
+    def _format_codes(self, content: str, max_codes: int) -> List[Dict[str, Any]]:
+        """Validate a structured response and return its codes as dictionaries."""
+        # Schema-valid output only needs codes stripped to alphanumerics
+        return [
+            {**cpt_code.model_dump(), 'code': ''.join(c for c in cpt_code.code if c.isalnum())}
+            for cpt_code in CPTCodeList.model_validate_json(content).codes[:max_codes]
+        ]
+    
+    def _prepare_prompt(self, document_text: str, max_codes: int) -> Tuple[str, Optional[int]]:
+        """Prepare the prompt for the AI model, returning it with the document's token count."""
+        document_text, document_tokens = self._truncate_document(document_text)
+        return CPT_GENERATION_PROMPT.format(
+            max_codes=max_codes,
+            document_text=document_text
+        ), document_tokens
+    
+    def _truncate_document(self, document_text: str) -> Tuple[str, Optional[int]]:
+        """Limit the document to MAX_DOCUMENT_TOKENS, or MAX_DOCUMENT_CHARS without a tokenizer."""
+        return truncate_to_tokens(document_text, self.MAX_DOCUMENT_TOKENS, self.TOKEN_ENCODING, self.MAX_DOCUMENT_CHARS)
     
     def get_code_details(self, code: str) -> Optional[Dict[str, Any]]:
         """
@@ -1,39 +1,128 @@
 """Document text extraction utilities"""
 
+import codecs
+import functools
+import importlib
 import io
-from typing import Optional
+import logging
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+# Public extraction API; everything else here is a private helper
+__all__ = [
+    'DocumentSource',
+    'extract_text_from_file',
+    'extract_text_batch',
+    'extract_title_from_file',
+    'extract_first_page_content',
+]
+
+# Configure professional logging
+logger = logging.getLogger(__name__)
+
+# Trailing " MM-DD-YYYY" date in document filenames
+_DATE_SUFFIX_RE = re.compile(r'\s+\d{2}-\d{2}-\d{4}$')
+
+# Uploaded document content: in-memory bytes, or a seekable binary file such as UploadFile.file
+DocumentSource = Union[bytes, BinaryIO]
+
+# WordprocessingML tags read when streaming DOCX body text
+_W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_W_BODY, _W_P, _W_TBL = _W_NS + 'body', _W_NS + 'p', _W_NS + 'tbl'
+_W_RUN_CONTAINERS = frozenset({_W_NS + 'r', _W_NS + 'hyperlink'})
+# Text equivalents of run content, matching python-docx's Paragraph.text (w:t and w:br handled separately)
+_W_RUN_SYMBOLS = {_W_NS + 'tab': '\t', _W_NS + 'ptab': '\t', _W_NS + 'cr': '\n', _W_NS + 'noBreakHyphen': '-'}
+
+# PDFium is not thread-safe; extraction runs in to_thread workers, so every document is
+# opened, read and closed under this lock
+_PDFIUM_LOCK = threading.Lock()
+
+# Headings that delimit the first section of an HTML document
+_HTML_HEADINGS = frozenset({'h1', 'h2', 'h3', 'h4'})
+
+# Elements whose contents are never visible page text
+_NON_VISIBLE_TAGS = ('script', 'style', 'template', 'noscript', 'svg')
+
+
+@functools.cache
+def _load_optional(module_name: str):
+    """Import an optional parser library once per process; None when it is not installed"""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+
+def _require(module_name: str):
+    """Return an optional parser module, raising ImportError when it is not installed"""
+    module = _load_optional(module_name)
+    if module is None:
+        raise ImportError(f"{module_name} is not installed")
+    return module
 
 
-def extract_text_from_file(file_content: bytes, filename: str) -> Optional[str]:
+def extract_text_from_file(file_content: DocumentSource, filename: str) -> Optional[str]:
     """
     Extract text from uploaded document
     
     Args:
-        file_content: Raw file bytes
+        file_content: Raw file bytes, or a binary file positioned at the start;
+            PDF and DOCX files are parsed from the file without buffering it
         filename: Original filename with extension
         
     Returns:
         str: Extracted text or None if unsupported format
     """
-    file_extension = filename.lower().split('.')[-1]
+    extractor = _FULL_EXTRACTORS.get(_file_extension(filename))
+    if extractor is None:
+        return None
     
     try:
-        if file_extension == 'txt':
-            return _extract_from_txt(file_content)
-        elif file_extension == 'pdf':
-            return _extract_from_pdf(file_content)
-        elif file_extension in ['doc', 'docx']:
-            return _extract_from_docx(file_content)
-        elif file_extension in ['html', 'htm']:
-            return _extract_from_html(file_content)
-        else:
-            return None
+        return extractor(file_content)
     except Exception as e:
-        print(f"Error extracting text from {filename}: {str(e)}")
+        logger.error("Error extracting text from %s: %s", filename, e)
         return None
 
 
-def extract_title_from_file(file_content: bytes, filename: str) -> Optional[str]:
+def extract_text_batch(
+    files: List[Tuple[bytes, str]],
+    workers: Optional[int] = None,
+    use_processes: bool = True
+) -> List[Optional[str]]:
+    """
+    Extract text from many documents in parallel
+    
+    PDF/DOCX parsing is CPU-bound, so in-memory buffers are spread across
+    processes; pass use_processes=False when reading is I/O-bound instead.
+    
+    Args:
+        files: (file_content, filename) pairs
+        workers: Pool size (default: one less than the CPU count)
+        use_processes: Use a process pool rather than a thread pool
+        
+    Returns:
+        list: Extracted text (or None) per file, in input order
+    """
+    if len(files) < 2:
+        return [_extract_text_worker(item) for item in files]
+    
+    max_workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        return list(executor.map(_extract_text_worker, files))
+
+
+def _extract_text_worker(item: Tuple[bytes, str]) -> Optional[str]:
+    """Pool entry point; module-level so process pools can pickle it"""
+    file_content, filename = item
+    return extract_text_from_file(file_content, filename)
+
+
+def extract_title_from_file(file_content: Optional[DocumentSource], filename: str) -> Optional[str]:
     """
     Extract title from filename by removing date and extension
     
@@ -42,7 +131,7 @@ def extract_title_from_file(file_content: bytes, filename: str) -> Optional[str]
     - HTML: "Allergens, Bedroom Dust Mites.html" → "Allergens, Bedroom Dust Mites"
     
     Args:
-        file_content: Raw file bytes (unused but kept for compatibility)
+        file_content: Document content (unused but kept for compatibility; may be None)
         filename: Original filename with extension
         
     Returns:
@@ -53,202 +142,353 @@ def extract_title_from_file(file_content: bytes, filename: str) -> Optional[str]
         name_without_ext = filename.rsplit('.', 1)[0]
         
         # Remove date pattern (MM-DD-YYYY) from the end
-        import re
-        # Pattern matches: space + MM-DD-YYYY at the end
-        clean_title = re.sub(r'\s+\d{2}-\d{2}-\d{4}$', '', name_without_ext)
+        clean_title = _DATE_SUFFIX_RE.sub('', name_without_ext)
         
         return clean_title.strip() if clean_title else name_without_ext
         
     except Exception as e:
-        print(f"Error extracting title from filename {filename}: {str(e)}")
+        logger.error("Error extracting title from filename %s: %s", filename, e)
         return filename.rsplit('.', 1)[0]  # Fallback: just remove extension
 
 
+# Byte-order marks checked before decoding; longest first so UTF-32 LE is not read as UTF-16 LE
+_BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+_BOM_PREFIXES = tuple(bom for bom, _ in _BOM_ENCODINGS)
 
+# Charset declared by <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
 
 
-def _extract_from_txt(file_content: bytes) -> str:
-    """Extract text from plain text file"""
+def _file_extension(filename: str) -> str:
+    """Return the lowercased extension of filename (the whole name when it has no dot)"""
+    return filename.rpartition('.')[2].lower()
+
+
+def _read_bytes(file_content: DocumentSource) -> bytes:
+    """Return the content as bytes, reading it from a file source"""
+    return file_content if isinstance(file_content, bytes) else file_content.read()
+
+
+def _as_stream(file_content: DocumentSource) -> BinaryIO:
+    """Return the content as a binary file, wrapping in-memory bytes (BytesIO shares, not copies, the buffer)"""
+    return io.BytesIO(file_content) if isinstance(file_content, bytes) else file_content
+
+
+def _decode_text(file_content: bytes) -> str:
+    """Decode document bytes: BOM sniff, then UTF-8, then latin-1 (which accepts any byte sequence)"""
+    for bom, encoding in _BOM_ENCODINGS:
+        if file_content.startswith(bom):
+            return file_content.decode(encoding)
     try:
         return file_content.decode('utf-8')
     except UnicodeDecodeError:
         return file_content.decode('latin-1')
 
 
-def _extract_from_pdf(file_content: bytes) -> str:
+def _decode_html(file_content: bytes) -> str:
+    """Decode HTML bytes: BOM sniff, then the <meta> declared charset, then _decode_text's fallbacks"""
+    if not file_content.startswith(_BOM_PREFIXES):
+        # Browsers only honor a declaration within the first 1024 bytes
+        match = _META_CHARSET_RE.search(file_content, 0, 1024)
+        if match:
+            try:
+                encoding = codecs.lookup(match.group(1).decode('ascii')).name
+                # As in browsers, latin-1 and ASCII labels mean windows-1252 (smart quotes, dashes)
+                if encoding in ('iso8859-1', 'ascii'):
+                    encoding = 'cp1252'
+                return file_content.decode(encoding)
+            except (LookupError, UnicodeDecodeError):
+                pass
+    return _decode_text(file_content)
+
+
+def _extract_from_txt(file_content: DocumentSource) -> str:
+    """Extract text from plain text file"""
+    return _decode_text(_read_bytes(file_content))
+
+
+def _extract_from_pdf(file_content: DocumentSource) -> str:
     """Extract text from PDF file"""
     try:
-        import PyPDF2
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        
-        return text.strip()
+        # C-backed PDFium is several times faster than PyPDF2's pure-Python parser
+        pdfium = _require('pypdfium2')
     except ImportError:
-        raise Exception("PyPDF2 not installed. Install with: pip install PyPDF2")
+        return _extract_from_pdf_pypdf2(file_content)
+    
+    # PDFium reads file sources through callbacks, so uploads are never copied into memory
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(file_content)
+        try:
+            page_texts = [_pdfium_page_text(pdf, index) for index in range(len(pdf))]
+        finally:
+            pdf.close()
+    return "\n".join(text for text in page_texts if text).strip()
 
 
+def _pdfium_page_text(pdf, index: int) -> str:
+    """Extract one page's text with PDFium, normalizing its CRLF line endings; call under _PDFIUM_LOCK"""
+    page = pdf[index]
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_range().replace('\r\n', '\n')
+    finally:
+        textpage.close()
+        page.close()
+
 
+def _extract_from_pdf_pypdf2(file_content: DocumentSource) -> str:
+    """Extract text from PDF file with PyPDF2 (fallback when pypdfium2 is missing)"""
+    try:
+        PyPDF2 = _require('PyPDF2')
+        pdf_reader = PyPDF2.PdfReader(_as_stream(file_content))
+        
+        # extract_text() can return None for image-only pages
+        page_texts = (page.extract_text() for page in pdf_reader.pages)
+        return "\n".join(text for text in page_texts if text).strip()
+    except ImportError:
+        raise Exception("PyPDF2 not installed. Install with: pip install pypdfium2")
 
 
-def _extract_from_docx(file_content: bytes) -> str:
+def _extract_from_docx(file_content: DocumentSource) -> str:
     """Extract text from Word document"""
+    etree = _load_optional('lxml.etree')
+    if etree is not None:
+        return _extract_from_docx_streaming(file_content, etree)
+    
     try:
-        from docx import Document
-        doc_file = io.BytesIO(file_content)
-        doc = Document(doc_file)
-        
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
+        Document = _require('docx').Document
+        doc = Document(_as_stream(file_content))
         
-        return text.strip()
+        return "\n".join(paragraph.text for paragraph in doc.paragraphs).strip()
     except ImportError:
         raise Exception("python-docx not installed. Install with: pip install python-docx")
 
 
-def _extract_from_html(file_content: bytes) -> str:
+def _extract_from_docx_streaming(file_content: DocumentSource, etree) -> str:
+    """Stream body paragraphs from word/document.xml, matching python-docx's paragraph text
+    without building its object model; finished elements are cleared to keep memory flat"""
+    paragraphs = []
+    with zipfile.ZipFile(_as_stream(file_content)) as archive, archive.open('word/document.xml') as document_xml:
+        for _, element in etree.iterparse(document_xml, events=('end',), tag=(_W_P, _W_TBL)):
+            parent = element.getparent()
+            if parent is None or parent.tag != _W_BODY:
+                continue  # Table-cell paragraphs are cleared with their table, as python-docx skips them too
+            
+            if element.tag == _W_P:
+                paragraphs.append(''.join(_docx_paragraph_parts(element)))
+            
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+    
+    return "\n".join(paragraphs).strip()
+
+
+def _docx_paragraph_parts(paragraph):
+    """Yield the text of a w:p's runs, including runs inside hyperlinks"""
+    for child in paragraph:
+        if child.tag not in _W_RUN_CONTAINERS:
+            continue
+        runs = (child,) if child.tag == _W_NS + 'r' else child.iterchildren(_W_NS + 'r')
+        for run in runs:
+            for item in run:
+                if item.tag == _W_NS + 't':
+                    yield item.text or ''
+                elif item.tag == _W_NS + 'br':
+                    # Only line breaks are text; page and column breaks are not
+                    if item.get(_W_NS + 'type', 'textWrapping') == 'textWrapping':
+                        yield '\n'
+                elif item.tag in _W_RUN_SYMBOLS:
+                    yield _W_RUN_SYMBOLS[item.tag]
+
+
+def _extract_from_html(file_content: DocumentSource) -> str:
     """Extract text from HTML file"""
     try:
-        from bs4 import BeautifulSoup
+        html_content = _decode_html(_read_bytes(file_content))
         
-        # Try different encodings
-        for encoding in ['utf-8', 'latin-1', 'cp1252']:
-            try:
-                html_content = file_content.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            return ""
+        # Text nodes are stripped and space-joined, collapsing template indentation in the same pass
+        tree = _parse_html_tree(html_content)
+        if tree is not None:
+            return ' '.join(text for text in map(str.strip, tree.itertext()) if text)
         
-        soup = BeautifulSoup(html_content, 'html.parser')
-        return soup.get_text().strip()
+        # lxml is unavailable here, so BeautifulSoup falls back to the pure-Python parser
+        soup = _require('bs4').BeautifulSoup(html_content, 'html.parser')
+        for tag in soup(_NON_VISIBLE_TAGS):
+            tag.decompose()
+        return soup.get_text(separator=' ', strip=True)
         
     except ImportError:
         raise Exception("BeautifulSoup not installed. Install with: pip install beautifulsoup4")
 
 
-def extract_first_page_content(file_content: bytes, filename: str, max_chars: int = 500) -> str:
+def _parse_html_tree(html_content: str):
+    """Parse HTML with lxml's C parser, dropping non-visible text; None when lxml is missing"""
+    lxml_html = _load_optional('lxml.html')
+    etree = _load_optional('lxml.etree')
+    if lxml_html is None or etree is None:
+        return None
+    
+    # Hand lxml bytes with an explicit encoding: it rejects str input carrying an XML
+    # encoding declaration, and the text is already decoded per its <meta> charset
+    parser = lxml_html.HTMLParser(encoding='utf-8')
+    tree = lxml_html.document_fromstring(html_content.encode('utf-8'), parser=parser)
+    # Skip non-visible subtrees and comments before the text walk
+    etree.strip_elements(tree, *_NON_VISIBLE_TAGS, with_tail=False)
+    etree.strip_tags(tree, etree.Comment)
+    return tree
+
+
+def extract_first_page_content(file_content: DocumentSource, filename: str, max_chars: int = 500) -> str:
     """
     Extract first page content for enhanced vector search
     
     Args:
-        file_content: Raw file bytes
+        file_content: Raw file bytes, or a binary file positioned at the start
         filename: Original filename with extension
         max_chars: Maximum characters to extract (default 500)
         
     Returns:
         str: First page content or empty string if extraction fails
     """
-    file_extension = filename.lower().split('.')[-1]
+    file_extension = _file_extension(filename)
+    extractor = _FIRST_PAGE_EXTRACTORS.get(file_extension)
+    if extractor is None:
+        logger.warning("Unsupported file type for first page extraction: %s", file_extension)
+        return ""
     
     try:
-        if file_extension == 'pdf':
-            return _extract_first_page_from_pdf(file_content, max_chars)
-        elif file_extension in ['html', 'htm']:
-            return _extract_first_page_from_html(file_content, max_chars)
-        elif file_extension in ['doc', 'docx']:
-            return _extract_first_page_from_docx(file_content, max_chars)
-        elif file_extension == 'txt':
-            return _extract_first_page_from_txt(file_content, max_chars)
-        else:
-            print(f"⚠️ Unsupported file type for first page extraction: {file_extension}")
-            return ""
+        return extractor(file_content, max_chars)
     except Exception as e:
-        print(f"❌ First page extraction failed for {filename}: {str(e)}")
+        logger.error("First page extraction failed for %s: %s", filename, e)
         return ""
 
 
-def _extract_first_page_from_pdf(file_content: bytes, max_chars: int) -> str:
+def _extract_first_page_from_pdf(file_content: DocumentSource, max_chars: int) -> str:
     """Extract first page from PDF file"""
     try:
-        import PyPDF2
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        if len(pdf_reader.pages) == 0:
-            print("⚠️ PDF has no pages")
+        try:
+            pdfium = _require('pypdfium2')
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(file_content)
+                try:
+                    page_count = len(pdf)
+                    # Extract ONLY first page (page 0)
+                    first_page_text = _pdfium_page_text(pdf, 0) if page_count else ""
+                finally:
+                    pdf.close()
+        except ImportError:
+            PyPDF2 = _require('PyPDF2')
+            pdf_reader = PyPDF2.PdfReader(_as_stream(file_content))
+            page_count = len(pdf_reader.pages)
+            # Extract ONLY first page (page 0)
+            first_page_text = pdf_reader.pages[0].extract_text() if page_count else ""
+        
+        if page_count == 0:
+            logger.warning("PDF has no pages")
             return ""
         
-        # Extract ONLY first page (page 0)
-        first_page_text = pdf_reader.pages[0].extract_text()
-        
         # Limit to max_chars
         limited_text = first_page_text[:max_chars] if first_page_text else ""
         
-        print(f"📄 PDF First Page Extracted: {len(limited_text)} chars")
-        print(f"🔍 First Page Preview: {limited_text[:100]}...")
+        logger.debug("PDF first page extracted: %d chars", len(limited_text))
+        logger.debug("First page preview: %.100s...", limited_text)
         
         return limited_text.strip()
         
     except ImportError:
-        print("❌ PyPDF2 not available for PDF first page extraction")
+        logger.error("No PDF library (pypdfium2 or PyPDF2) available for PDF first page extraction")
         return ""
 
 
-def _extract_first_page_from_html(file_content: bytes, max_chars: int) -> str:
+def _extract_first_page_from_html(file_content: DocumentSource, max_chars: int) -> str:
     """Extract first section from HTML file"""
     try:
-        from bs4 import BeautifulSoup
-        
-        # Try different encodings
-        for encoding in ['utf-8', 'latin-1', 'cp1252']:
-            try:
-                html_content = file_content.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            print("⚠️ Could not decode HTML content")
-            return ""
+        html_content = _decode_html(_read_bytes(file_content))
+        
+        output_lines = _iter_first_html_section(html_content)
+        
+        if output_lines is None:
+            body = _require('bs4').BeautifulSoup(html_content, 'html.parser').body
+            
+            output_lines = []
+            heading_seen = False
+            
+            for tag in body.children:
+                if getattr(tag, 'name', None) is None:
+                    continue
+                
+                if tag.name in _HTML_HEADINGS:
+                    if heading_seen:
+                        break
+                    heading_seen = True
+                
+                if tag.name != 'img' and tag.name not in _NON_VISIBLE_TAGS:
+                    text = tag.get_text(strip=True)
+                    if text:
+                        output_lines.append(text)
         
-        soup = BeautifulSoup(html_content, 'html.parser')
+        limited_text = '\n'.join(output_lines)
+
+        logger.debug("HTML first section extracted: %d chars", len(limited_text))
+        logger.debug("First section preview: %.100s...", limited_text)
         
-        # Get first meaningful content section
-        # content_text = soup.body.get_text()
-        # limited_text = content_text[:max_chars] if content_text else ""
+        return limited_text.strip()
         
-        body = soup.body
-
-        output_lines = []
-        heading_seen = False
+    except ImportError:
+        logger.error("BeautifulSoup not available for HTML first page extraction")
+        return ""
 
-        for tag in body.children:
-            if getattr(tag, 'name', None) is None:
-                continue
 
-            if tag.name in ['h1', 'h2', 'h3', 'h4']:
+def _iter_first_html_section(html_content: str) -> Optional[List[str]]:
+    """Stream body children up to the second heading with lxml.iterparse; None when lxml is missing"""
+    etree = _load_optional('lxml.etree')
+    if etree is None:
+        return None
+    
+    output_lines = []
+    heading_seen = False
+    depth = 0  # html=1, body=2, body children=3
+    
+    # Parsing stops at the second heading, so only the first section is ever built
+    events = etree.iterparse(
+        io.BytesIO(html_content.encode('utf-8')), events=('start', 'end'),
+        html=True, encoding='utf-8', remove_comments=True
+    )
+    for event, element in events:
+        if event == 'start':
+            depth += 1
+            if depth == 3 and element.tag in _HTML_HEADINGS and element.getparent().tag == 'body':
                 if heading_seen:
                     break
                 heading_seen = True
-
-            if tag.name not in ['img', 'script', 'style']:
-                text = tag.get_text(strip=True)
+            continue
+        
+        depth -= 1
+        parent = element.getparent()
+        if depth == 2 and parent is not None and parent.tag == 'body':
+            if element.tag != 'img' and element.tag not in _NON_VISIBLE_TAGS:
+                etree.strip_elements(element, *_NON_VISIBLE_TAGS, with_tail=False)
+                text = ''.join(part.strip() for part in element.itertext())
                 if text:
                     output_lines.append(text)
-
-        limited_text = '\n'.join(output_lines)
-
-        print(f"🌐 HTML First Section Extracted: {len(limited_text)} chars")
-        print(f"🔍 First Section Preview: {limited_text}...")
-        
-        return limited_text.strip()
-        
-    except ImportError:
-        print("❌ BeautifulSoup not available for HTML first page extraction")
-        return ""
+            # Completed sections are no longer needed; keep memory bounded
+            element.clear(keep_tail=True)
+    
+    return output_lines
 
 
-def _extract_first_page_from_docx(file_content: bytes, max_chars: int) -> str:
+def _extract_first_page_from_docx(file_content: DocumentSource, max_chars: int) -> str:
     """Extract first section from Word document"""
     try:
-        from docx import Document
-        doc_file = io.BytesIO(file_content)
-        doc = Document(doc_file)
+        Document = _require('docx').Document
+        doc = Document(_as_stream(file_content))
         
         # Extract text until we reach max_chars (approximate first page)
         text_parts = []
@@ -268,34 +508,48 @@ def _extract_first_page_from_docx(file_content: bytes, max_chars: int) -> str:
         
         limited_text = " ".join(text_parts)
         
-        print(f"📝 DOCX First Section Extracted: {len(limited_text)} chars")
-        print(f"🔍 First Section Preview: {limited_text[:100]}...")
+        logger.debug("DOCX first section extracted: %d chars", len(limited_text))
+        logger.debug("First section preview: %.100s...", limited_text)
         
         return limited_text.strip()
         
     except ImportError:
-        print("❌ python-docx not available for DOCX first page extraction")
+        logger.error("python-docx not available for DOCX first page extraction")
         return ""
 
 
-def _extract_first_page_from_txt(file_content: bytes, max_chars: int) -> str:
+def _extract_first_page_from_txt(file_content: DocumentSource, max_chars: int) -> str:
     """Extract first section from text file"""
     try:
-        try:
-            text_content = file_content.decode('utf-8')
-        except UnicodeDecodeError:
-            text_content = file_content.decode('latin-1')
+        text_content = _decode_text(_read_bytes(file_content))
         
         limited_text = text_content[:max_chars]
         
-        print(f"📄 TXT First Section Extracted: {len(limited_text)} chars")
-        print(f"🔍 First Section Preview: {limited_text[:100]}...")
+        logger.debug("TXT first section extracted: %d chars", len(limited_text))
+        logger.debug("First section preview: %.100s...", limited_text)
         
         return limited_text.strip()
         
     except Exception as e:
-        print(f"❌ TXT first page extraction failed: {e}")
+        logger.error("TXT first page extraction failed: %s", e)
         return ""
 
 
- 
\ No newline at end of file
+# Extension dispatch tables, defined after the extractors they reference
+_FULL_EXTRACTORS = {
+    'txt': _extract_from_txt,
+    'pdf': _extract_from_pdf,
+    'doc': _extract_from_docx,
+    'docx': _extract_from_docx,
+    'html': _extract_from_html,
+    'htm': _extract_from_html,
+}
+
+_FIRST_PAGE_EXTRACTORS = {
+    'txt': _extract_first_page_from_txt,
+    'pdf': _extract_first_page_from_pdf,
+    'doc': _extract_first_page_from_docx,
+    'docx': _extract_first_page_from_docx,
+    'html': _extract_first_page_from_html,
+    'htm': _extract_first_page_from_html,
+}
@@ -0,0 +1,174 @@
+"""Persistent exact-match cache for LLM completion content."""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+# Configure professional logging
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+CACHE_BYPASS = os.getenv("CACHE_BYPASS") == "1"  # Set for eval runs that must hit the API
+
+
+class LLMCache:
+    """SQLite-backed store of raw completion content keyed by request hash,
+    fronted by a small in-process LRU so repeat hits skip the database.
+
+    The cache never fails a completion: SQLite errors (read-only directory,
+    "database is locked") are logged and treated as misses, and an unusable
+    database leaves only the in-process tier.
+    """
+
+    MEMORY_ENTRIES = 4096
+    PRUNE_EVERY_WRITES = 256  # Expired rows are deleted at startup and after this many writes
+
+    def __init__(self, path: str = LLM_CACHE_PATH, memory_entries: int = MEMORY_ENTRIES):
+        self.path = path
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (content, expires_at)
+        self._memory_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    "key TEXT PRIMARY KEY, content TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS completions_expires_at ON completions (expires_at)")
+            self._conn = conn
+            self._prune_expired()
+            logger.info(f"LLM response cache initialized at {path}")
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache database unavailable at {path}, caching in memory only: {e}")
+
+    def get_from_memory(self, key: str) -> Optional[str]:
+        """Return content for key from the in-process tier only, without touching SQLite."""
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            content, expires_at = entry
+            if expires_at < time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return content
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached content for key, or None when missing or expired."""
+        content = self.get_from_memory(key)
+        if content is not None:
+            return content
+
+        if self._conn is None:
+            return None
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT content, expires_at FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed for key {key[:12]}: {e}")
+            return None
+
+        if row is None:
+            return None
+
+        content, expires_at = row
+        if expires_at < time.time():
+            # Expired rows are removed by the periodic prune
+            return None
+
+        self._remember(key, content, expires_at)
+        return content
+
+    def set(self, key: str, content: str, ttl: float) -> None:
+        """Store content under key for ttl seconds."""
+        expires_at = time.time() + ttl
+        self._remember(key, content, expires_at)
+        if self._conn is None:
+            return
+
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, content, expires_at) VALUES (?, ?, ?)",
+                    (key, content, expires_at)
+                )
+                self._writes += 1
+                prune = self._writes % self.PRUNE_EVERY_WRITES == 0
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed for key {key[:12]}: {e}")
+            return
+
+        if prune:
+            self._prune_expired()
+
+    def _prune_expired(self) -> None:
+        """Delete expired rows so the table does not grow without bound."""
+        try:
+            with self._lock, self._conn:
+                deleted = self._conn.execute(
+                    "DELETE FROM completions WHERE expires_at < ?", (time.time(),)
+                ).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache prune failed: {e}")
+            return
+        if deleted:
+            logger.info(f"Pruned {deleted} expired LLM cache entries")
+
+    def _remember(self, key: str, content: str, expires_at: float) -> None:
+        """Add an entry to the in-process tier, evicting the least recently used when full."""
+        with self._memory_lock:
+            self._memory[key] = (content, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    """Return the process-wide cache, opening the database on first use."""
+    global _cache
+    if _cache is None:
+        _cache = LLMCache()
+    return _cache
+
+
+def make_cache_key(request: Dict[str, Any]) -> str:
+    """Hash a full request body (model, messages, sampling parameters) into a cache key."""
+    return hashlib.blake2b(orjson.dumps(request, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+async def cached_completion(key: str, ttl: float, create: Callable[[], Awaitable[str]]) -> str:
+    """Return cached completion content for key, calling create() and storing its result on a miss."""
+    if CACHE_BYPASS:
+        return await create()
+
+    cache = get_llm_cache()
+    # In-process hits are answered on the loop; only SQLite lookups need a thread
+    content = cache.get_from_memory(key)
+    if content is None:
+        content = await asyncio.to_thread(cache.get, key)
+    if content is not None:
+        logger.info(f"LLM cache hit for key {key[:12]}")
+        return content
+
+    content = await create()
+    await asyncio.to_thread(cache.set, key, content, ttl)
+    return content
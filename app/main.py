@@ -1,35 +1,79 @@
 """Medical coding system with deterministic processing and official ICD validation."""
 
+import asyncio
+import atexit
 import logging
 import os
-from fastapi import FastAPI, HTTPException, File, UploadFile, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+import queue
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import FastAPI, HTTPException, File, UploadFile, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
 from typing import Dict, Any, List, Optional
-from bs4 import BeautifulSoup
-import json
 
-from .models import SpreadsheetRow, RefinedCodeValidation
-from .document_reader import extract_title_from_file, extract_text_from_file, extract_first_page_content
+from .models import RefinedCodeValidation
+from .document_reader import extract_title_from_file, extract_text_from_file
 from .medical_engine import MedicalCodingEngine
-from .metadata_generator import MetadataGenerator
-from .metadata_extractor import extract_embedded_metadata
 from .cpt_generator import CPTGenerator  # Import the new CPT generator
+from .config import THREAD_POOL_WORKERS, close_openai_clients
+
+# Configure professional logging; request paths only enqueue records, a listener thread does the stream I/O
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_queue = queue.SimpleQueue()
+_log_queue_handler = QueueHandler(_log_queue)
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Records are fully formatted by the listener
+_log_listener = QueueListener(_log_queue, _log_stream_handler, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # Flushes queued records on exit
 
-# Configure professional logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.StreamHandler(),
+        _log_queue_handler,
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Engines are built by the lifespan handler so importing this module stays cheap
+medical_engine: Optional[MedicalCodingEngine] = None
+cpt_generator: Optional[CPTGenerator] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Size the thread pool and build the engines on startup; release OpenAI connections on shutdown."""
+    global medical_engine, cpt_generator
+    
+    # The default executor behind asyncio.to_thread (CPU count + 4) is too small
+    # for the blocking network calls the pipelines offload to it
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=THREAD_POOL_WORKERS, thread_name_prefix="blocking-io")
+    )
+    
+    # The ICD-10-CM XML load and the Pinecone index handshake are blocking,
+    # so the engines are built in worker threads alongside each other
+    medical_engine, cpt_generator = await asyncio.gather(
+        asyncio.to_thread(MedicalCodingEngine),
+        asyncio.to_thread(CPTGenerator)
+    )
+    
+    try:
+        yield
+    finally:
+        await close_openai_clients()
+
 # Initialize FastAPI
-app = FastAPI(title="Medical Coding System", version="4.0.0")  # Bumped version to 4.0.0 for major update
+app = FastAPI(
+    title="Medical Coding System",
+    version="4.0.0",  # Bumped version to 4.0.0 for major update
+    default_response_class=ORJSONResponse,  # orjson serializes the code-list payloads several times faster than json
+    lifespan=lifespan
+)
 
 # Add CORS middleware for AWS compatibility
 app.add_middleware(
@@ -53,15 +97,21 @@ logger.info(f"Static directory: {STATIC_DIR}")
 
 # Initialize templates and static files
 try:
-    templates = Jinja2Templates(directory=TEMPLATES_DIR)
+    # Compiled templates persist across restarts; set TEMPLATE_AUTO_RELOAD=1 while editing them
+    templates = Jinja2Templates(env=Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=select_autoescape(),  # Starlette's default environment escapes HTML; keep that
+        bytecode_cache=FileSystemBytecodeCache(),
+        auto_reload=os.getenv("TEMPLATE_AUTO_RELOAD") == "1"
+    ))
     app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 except Exception as e:
     logger.error(f"Template/static file initialization error: {str(e)}")
     raise
 
-# Initialize engines
-medical_engine = MedicalCodingEngine()
-cpt_generator = CPTGenerator()  # Initialize the CPT generator
+# Documents analyzed at once, and accepted per request, by /api/analyze-batch
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "8"))
+ANALYZE_BATCH_MAX_FILES = int(os.getenv("ANALYZE_BATCH_MAX_FILES", "50"))
 
 # ===== ROUTES =====
 
@@ -84,53 +134,18 @@ async def cpt_interface(request: Request):
 async def analyze_document(file: UploadFile = File(..., max_size=1024 * 1024 * 1024)):
     """Analyze single document - preserving exact response format."""
     try:
-        # Read file content
-        file_content = await file.read()
+        require_engines()
+        
+        # Title comes from the filename alone, so no content is needed
+        title = extract_title_from_file(None, file.filename) or "Untitled Document"
         
-        # Extract text from the document
-        text_content = extract_text_from_file(file_content, file.filename)
+        # Extract text in a worker thread so PDF/DOCX parsing overlaps other requests' model I/O;
+        # the spooled upload is parsed in place rather than copied into memory
+        text_content = await asyncio.to_thread(extract_text_from_file, file.file, file.filename)
         if not text_content:
             raise HTTPException(status_code=400, detail="Unsupported file format or empty file")
         
-        # Generate CPT codes (temporarily disable if causing issues)
-        cpt_codes = []
-        try:
-            cpt_generator = CPTGenerator()
-            cpt_codes = await cpt_generator.generate_cpt_codes(text_content)
-        except Exception as e:
-            logger.error(f"Error generating CPT codes: {str(e)}", exc_info=True)
-            # Continue with empty CPT codes if generation fails
-            
-        # Process with existing medical engine for ICD-10 codes
-        title = extract_title_from_file(file_content, file.filename) or "Untitled Document"
-        first_page = extract_first_page_content(file_content, file.filename)
-        
-        # Get ICD-10 codes
-        icd_response = await medical_engine.extract_codes_for_spreadsheet(
-            title=title,
-            content=text_content
-        )
-        
-        # Combine results
-        result = {
-            "status": "success",
-            "document_title": title,
-            "cpt_codes": cpt_codes,
-            "icd_codes": {
-                "root_codes": extract_root_codes_simple(icd_response.refined_codes),
-                "hierarchy_codes": extract_hierarchy_codes_simple(icd_response.refined_codes),
-                "enhanced_descriptions": format_enhanced_descriptions(icd_response.refined_codes),
-                "confidence_scores": format_confidence_scores(icd_response.refined_codes),
-                "structured_codes": format_structured_codes(icd_response.refined_codes)
-            },
-            "metadata": {
-                "document_type": file.content_type,
-                "file_name": file.filename,
-                "file_size": len(file_content)
-            }
-        }
-        
-        return result
+        return await analyze_text_content(file, title, text_content)
         
     except HTTPException:
         raise
@@ -142,22 +157,16 @@ async def analyze_document(file: UploadFile = File(..., max_size=1024 * 1024 * 1
 async def analyze_cpt_only(file: UploadFile = File(..., max_size=1024 * 1024 * 1024)):
     """Analyze document and return only CPT codes."""
     try:
-        # Read file content
-        file_content = await file.read()
+        require_engines()
         
-        # Extract text from the document
-        text_content = extract_text_from_file(file_content, file.filename)
+        # Extract text in a worker thread so parsing does not block the event loop;
+        # the spooled upload is parsed in place rather than copied into memory
+        text_content = await asyncio.to_thread(extract_text_from_file, file.file, file.filename)
         if not text_content:
             raise HTTPException(status_code=400, detail="Unsupported file format or empty file")
         
-        # Generate CPT codes (synchronously)
-        cpt_codes = []
-        try:
-            cpt_generator = CPTGenerator()
-            cpt_codes = cpt_generator.generate_cpt_codes(text_content)
-        except Exception as e:
-            logger.error(f"Error generating CPT codes: {str(e)}", exc_info=True)
-            # Continue with empty CPT codes if generation fails
+        # Generate CPT codes
+        cpt_codes = await generate_cpt_codes_safely(text_content)
             
         return {
             "status": "success",
@@ -165,7 +174,7 @@ async def analyze_cpt_only(file: UploadFile = File(..., max_size=1024 * 1024 * 1
             "metadata": {
                 "document_type": file.content_type,
                 "file_name": file.filename,
-                "file_size": len(file_content)
+                "file_size": file.size
             }
         }
         
@@ -175,51 +184,146 @@ async def analyze_cpt_only(file: UploadFile = File(..., max_size=1024 * 1024 * 1
         logger.error(f"Error processing document for CPT codes: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
-# ===== HELPER FUNCTIONS =====
+@app.post("/api/analyze-batch")
+async def analyze_documents(files: List[UploadFile] = File(...)):
+    """Analyze many documents in one request, returning one /api/analyze-style result per file."""
+    require_engines()
+    if len(files) > ANALYZE_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {ANALYZE_BATCH_MAX_FILES} files can be analyzed per request")
+    
+    try:
+        # Parse every upload in the worker pool, then embed all readable documents in batched requests
+        text_contents = await asyncio.gather(*(
+            asyncio.to_thread(extract_text_from_file, file.file, file.filename) for file in files
+        ))
+        readable = [index for index, text_content in enumerate(text_contents) if text_content]
+        embeddings: Dict[int, Optional[List[float]]] = dict.fromkeys(readable)
+        if readable:
+            try:
+                embeddings.update(zip(
+                    readable,
+                    await medical_engine.vector_engine.embed_texts([text_contents[index] for index in readable])
+                ))
+            except Exception as e:
+                # Documents left without an embedding create their own, so failures are reported per file
+                logger.warning(f"Batch embedding failed, embedding documents individually: {str(e)}")
+        
+        # Bound documents in flight; each one still fans out to CPT and ICD model calls
+        semaphore = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
+        
+        async def analyze_one(index: int, file: UploadFile) -> Dict[str, Any]:
+            if index not in embeddings:
+                return {
+                    "status": "error",
+                    "detail": "Unsupported file format or empty file",
+                    "metadata": {"file_name": file.filename}
+                }
+            
+            title = extract_title_from_file(None, file.filename) or "Untitled Document"
+            async with semaphore:
+                try:
+                    return await analyze_text_content(file, title, text_contents[index], embeddings[index])
+                except Exception as e:
+                    logger.error(f"Error processing document {file.filename}: {str(e)}", exc_info=True)
+                    return {
+                        "status": "error",
+                        "detail": f"Error processing document: {str(e)}",
+                        "metadata": {"file_name": file.filename}
+                    }
+        
+        results = await asyncio.gather(*(analyze_one(index, file) for index, file in enumerate(files)))
+        
+        return {"status": "success", "results": results}
+        
+    except Exception as e:
+        logger.error(f"Error processing document batch: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
 
-def extract_root_codes_simple(codes: List[RefinedCodeValidation]) -> List[str]:
-    """Extract unique root codes (first 3 characters)"""
-    root_codes = set()
-    for code in codes:
-        if hasattr(code, 'icd_code') and code.icd_code and len(code.icd_code) >= 3:
-            # Extract root code (first 3 characters before any dot)
-            root_code = code.icd_code.split('.')[0]
-            if len(root_code) >= 3:
-                root_codes.add(root_code[:3])
-    return sorted(root_codes)
-
-def extract_hierarchy_codes_simple(codes: List[RefinedCodeValidation]) -> List[str]:
-    """Extract full hierarchy codes"""
-    return [code.icd_code for code in codes if hasattr(code, 'icd_code') and code.icd_code]
-
-def format_enhanced_descriptions(codes: List[RefinedCodeValidation]) -> List[str]:
-    """Format enhanced descriptions as 'CODE: Enhanced Description'"""
-    return [
-        f"{code.icd_code}: {code.enhanced_description}"
-        for code in codes
-        if hasattr(code, 'icd_code') and code.icd_code and hasattr(code, 'enhanced_description') and code.enhanced_description
-    ]
+# ===== HELPER FUNCTIONS =====
 
-def format_confidence_scores(codes: List[RefinedCodeValidation]) -> Dict[str, float]:
-    """Format confidence scores as 'CODE: XX%'"""
+async def analyze_text_content(
+    file: UploadFile,
+    title: str,
+    text_content: str,
+    embedding: Optional[List[float]] = None
+) -> Dict[str, Any]:
+    """Run the CPT and ICD-10 pipelines on extracted text and build the analysis response"""
+    # CPT and ICD-10 pipelines are independent; run their model calls concurrently
+    cpt_codes, icd_response = await asyncio.gather(
+        generate_cpt_codes_safely(text_content),
+        medical_engine.extract_codes_for_spreadsheet(
+            title=title,
+            content=text_content,
+            embedding=embedding
+        )
+    )
+    
+    # Combine results
     return {
-        code.icd_code: round(code.confidence_score * 100)
-        for code in codes
-        if hasattr(code, 'icd_code') and code.icd_code and hasattr(code, 'confidence_score') and code.confidence_score is not None
+        "status": "success",
+        "document_title": title,
+        "cpt_codes": cpt_codes,
+        "icd_codes": format_icd_codes(icd_response.refined_codes),
+        "metadata": {
+            "document_type": file.content_type,
+            "file_name": file.filename,
+            "file_size": file.size
+        }
     }
 
-def format_structured_codes(codes: List[RefinedCodeValidation]) -> List[Dict[str, Any]]:
-    """Format codes as structured data for enhanced export capabilities"""
-    return [
-        {
-            'code': code.icd_code,
+def require_engines() -> None:
+    """Reject API requests with a 503 until the lifespan handler has built the engines"""
+    if medical_engine is None or cpt_generator is None:
+        raise HTTPException(status_code=503, detail="Service is starting up, please retry shortly")
+
+async def generate_cpt_codes_safely(text_content: str) -> List[Dict[str, Any]]:
+    """Generate CPT codes, returning an empty list if generation fails"""
+    try:
+        return await cpt_generator.generate_cpt_codes(text_content)
+    except Exception as e:
+        logger.error(f"Error generating CPT codes: {str(e)}", exc_info=True)
+        # Continue with empty CPT codes if generation fails
+        return []
+
+def format_icd_codes(codes: List[RefinedCodeValidation]) -> Dict[str, Any]:
+    """Build every ICD-10 response view (root codes, hierarchy codes, 'CODE: Enhanced Description'
+    strings, 'CODE: XX%' scores and structured export rows) in a single pass over the codes"""
+    root_codes = set()
+    hierarchy_codes = []
+    enhanced_descriptions = []
+    confidence_scores = {}
+    structured_codes = []
+    
+    for code in codes:
+        icd_code = code.icd_code
+        if not icd_code:
+            continue
+        
+        # Root code is the first 3 characters before any dot
+        root_code = icd_code.partition('.')[0]
+        if len(root_code) >= 3:
+            root_codes.add(root_code[:3])
+        
+        hierarchy_codes.append(icd_code)
+        if code.enhanced_description:
+            enhanced_descriptions.append(f"{icd_code}: {code.enhanced_description}")
+        
+        percentage = code.confidence_score * 100
+        confidence_scores[icd_code] = round(percentage)
+        structured_codes.append({
+            'code': icd_code,
             'description': code.original_description,
-            'enhanced_description': code.enhanced_description if hasattr(code, 'enhanced_description') else '',
-            'confidence': round(code.confidence_score * 100, 2) if hasattr(code, 'confidence_score') else 0.0
-        }
-        for code in codes
-        if hasattr(code, 'icd_code') and code.icd_code
-    ]
+            'enhanced_description': code.enhanced_description,
+            'confidence': round(percentage, 2)
+        })
+    
+    return {
+        "root_codes": sorted(root_codes),
+        "hierarchy_codes": hierarchy_codes,
+        "enhanced_descriptions": enhanced_descriptions,
+        "confidence_scores": confidence_scores,
+        "structured_codes": structured_codes
+    }
 
 if __name__ == "__main__":
     import uvicorn
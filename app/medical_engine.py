@@ -4,7 +4,9 @@ from typing import List, Dict, Optional, Set
 import simple_icd_10_cm as icd_lib
 from .vector_search import VectorSearchEngine
 from .ai_selector import AICodeSelector
+from .semantic_cache import SemanticCache, ENABLE_SEMANTIC_CACHE
 from .models import RefinedCodeValidation, ClinicalRefinementResponse
+import asyncio
 import hashlib
 import logging
 
@@ -17,6 +19,7 @@ class MedicalCodingEngine:
     def __init__(self):
         self.vector_engine = VectorSearchEngine()
         self.ai_selector = AICodeSelector()
+        self.semantic_cache = SemanticCache() if ENABLE_SEMANTIC_CACHE else None
         self._initialize_official_icd_library()
     
     def _initialize_official_icd_library(self) -> None:
@@ -47,13 +50,19 @@ class MedicalCodingEngine:
             logger.error(f"Failed to initialize ICD library: {e}")
             raise RuntimeError(f"Critical failure loading official ICD data: {e}")
     
-    async def extract_codes_for_spreadsheet(self, title: str, content: Optional[str] = None) -> ClinicalRefinementResponse:
+    async def extract_codes_for_spreadsheet(
+        self,
+        title: str,
+        content: Optional[str] = None,
+        embedding: Optional[List[float]] = None
+    ) -> ClinicalRefinementResponse:
         """
         Extract ICD codes maintaining exact response format for spreadsheet processing.
         
         Args:
             title: Document title
             content: Optional document content
+            embedding: Optional precomputed embedding of the search text (content or title)
             
         Returns:
             ClinicalRefinementResponse: Existing format with refined_codes and clinical_summary
@@ -61,7 +70,10 @@ class MedicalCodingEngine:
         logger.info(f"Starting code extraction for: {title[:50]}...")
         
         # Stage 1: Use search text directly (already prepared deterministically)
-        candidates = await self.vector_engine.search_codes(content or title)
+        search_text = content or title
+        if embedding is None:
+            embedding = await self.vector_engine.embed_text(search_text)
+        candidates = await self.vector_engine.search_codes(search_text, embedding=embedding)
         
         if not candidates:
             logger.warning("No vector search candidates found")
@@ -72,8 +84,13 @@ class MedicalCodingEngine:
         
         logger.info(f"Vector search returned {len(candidates)} candidate codes")
         
-        # Stage 2: AI selection with root family validation
-        selected_codes = await self.ai_selector.select_relevant_codes(content or title, candidates)
+        # Stage 2: AI selection with root family validation; near-duplicate documents reuse
+        # an earlier selection when the semantic cache is enabled
+        selected_codes = self.semantic_cache.get(embedding) if self.semantic_cache else None
+        if selected_codes is None:
+            selected_codes = await self.ai_selector.select_relevant_codes(search_text, candidates)
+            if self.semantic_cache and selected_codes:
+                self.semantic_cache.set(embedding, selected_codes)
         
         if not selected_codes:
             logger.warning("No codes selected by AI analysis")
@@ -85,8 +102,8 @@ class MedicalCodingEngine:
         logger.info(f"AI selected {len(selected_codes)} codes for hierarchy completion")
         logger.info(f"Selected codes: {selected_codes}")
         
-        # Stage 3: Official hierarchy completion with family focus
-        refined_codes = self._complete_hierarchy_with_family_focus(selected_codes, content or title)
+        # Stage 3: Official hierarchy completion with family focus (ICD library walk, run off the event loop)
+        refined_codes = await asyncio.to_thread(self._complete_hierarchy_with_family_focus, selected_codes, search_text)
         
         summary = self._generate_clinical_summary(selected_codes, refined_codes)
         
@@ -97,17 +114,6 @@ class MedicalCodingEngine:
             clinical_summary=summary
         )
     
-    def _prepare_search_text(self, title: str, content: Optional[str] = None) -> str:
-        """Prepare search text with smart enhancement."""
-        if content and len(content.strip()) > 50:
-            # Use content if substantial
-            search_text = f"{title} {content[:500]}"
-        else:
-            # Use title, duplicate if short
-            search_text = f"{title} {title}" if len(title) < 50 else title
-        
-        return search_text.strip()
-    
     def _complete_hierarchy_with_family_focus(self, selected_codes: List[str], search_text: str) -> List[RefinedCodeValidation]:
         """Complete hierarchy using official ICD structure with family focus validation."""
         
@@ -130,7 +136,7 @@ class MedicalCodingEngine:
                 descendants = self._get_nearby_descendants(code)
                 family_filtered_descendants = [
                     desc for desc in descendants 
-                    if self._extract_root_family(desc) in allowed_families and not self._is_root_code(desc)
+                    if desc[:3] in allowed_families and not (len(desc) == 3 and desc.isalnum())
                 ]
                 
                 # Add selected code - include root codes only if they have no valid descendants
@@ -157,6 +163,7 @@ class MedicalCodingEngine:
         # Convert to RefinedCodeValidation objects with validation
         refined_codes = []
         validation_errors = []
+        selected_lookup = set(selected_codes)  # Built once; confidence scoring checks membership per code
         
         for code in sorted(all_codes):
             try:
@@ -169,11 +176,12 @@ class MedicalCodingEngine:
                     validation_errors.append(f"Root code filtered: {code}")
                     continue
                 
+                official_description = icd_lib.get_description(code)
                 refined_code = RefinedCodeValidation(
                     icd_code=code,
-                    original_description=icd_lib.get_description(code),
-                    enhanced_description=self._create_enhanced_description(code),
-                    confidence_score=self._calculate_confidence_score(code, selected_codes)
+                    original_description=official_description,
+                    enhanced_description=self._create_enhanced_description(code, official_description),
+                    confidence_score=self._calculate_confidence_score(code, selected_lookup)
                 )
                 refined_codes.append(refined_code)
                 
@@ -191,20 +199,12 @@ class MedicalCodingEngine:
     
     def _extract_allowed_root_families(self, codes: List[str]) -> Set[str]:
         """Extract unique root families from code list."""
-        return set([self._extract_root_family(code) for code in codes])
-    
-    def _extract_root_family(self, code: str) -> str:
-        """Extract root family (first 3 characters) from ICD code."""
-        return code[:3] if len(code) >= 3 else code
+        return {code[:3] for code in codes}
     
     def _is_root_code(self, code: str) -> bool:
         """Check if code is a root code (3 characters without decimal)."""
         return len(code) == 3 and code.isalnum()
     
-    def _get_all_descendants(self, code: str) -> List[str]:
-        """Get most relevant descendants with intelligent prioritization to prevent Excel overflow."""
-        return self._get_nearby_descendants(code, max_codes=25)
-    
     def _get_nearby_descendants(self, code: str, max_codes: int = 25) -> List[str]:
         """Get most relevant descendants with intelligent prioritization."""
         all_descendants = []
@@ -244,10 +244,14 @@ class MedicalCodingEngine:
         
         return final_descendants
     
-    def _create_enhanced_description(self, code: str) -> str:
-        """Create enhanced description using official ICD data."""
+    def _create_enhanced_description(self, code: str, official_description: Optional[str] = None) -> str:
+        """Create enhanced description using official ICD data.
+        
+        Callers that already looked up the official description pass it in to skip a second lookup.
+        """
         try:
-            official_description = icd_lib.get_description(code)
+            if official_description is None:
+                official_description = icd_lib.get_description(code)
             
             # Add inclusion terms if available
             inclusion_terms = icd_lib.get_inclusion_term(code)
@@ -262,7 +266,7 @@ class MedicalCodingEngine:
             logger.error(f"Error creating enhanced description for {code}: {e}")
             return f"Code {code} - Description unavailable"
     
-    def _calculate_confidence_score(self, code: str, selected_codes: List[str]) -> float:
+    def _calculate_confidence_score(self, code: str, selected_codes: Set[str]) -> float:
         """Calculate confidence score based on code type and selection."""
         try:
             if code in selected_codes:
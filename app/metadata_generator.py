@@ -1,20 +1,43 @@
 """Document metadata generation with deterministic processing."""
 
-from openai import OpenAI
 from typing import Optional
 from .models import DocumentMetadata, EnhancedTerminology
-from .prompts import METADATA_GENERATION_PROMPT, ENHANCED_TERMINOLOGY_PROMPT
-from .config import OPENAI_API_KEY
-import json
+from .prompts import (
+    METADATA_SYSTEM_PROMPT, METADATA_GENERATION_PROMPT,
+    TERMINOLOGY_SYSTEM_PROMPT, ENHANCED_TERMINOLOGY_PROMPT
+)
+from .config import OPENAI_CLIENT
+
+# Request constants, built once at import so each call only allocates its user message
+# Static instructions lead so requests share a cacheable prefix; document fields come last
+_METADATA_SYSTEM_MESSAGE = {"role": "system", "content": METADATA_SYSTEM_PROMPT}
+_TERMINOLOGY_SYSTEM_MESSAGE = {"role": "system", "content": TERMINOLOGY_SYSTEM_PROMPT}
+_METADATA_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "document_metadata",
+        "strict": True,
+        "schema": DocumentMetadata.model_json_schema()
+    }
+}
+_TERMINOLOGY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "enhanced_terminology",
+        "strict": True,
+        "schema": EnhancedTerminology.model_json_schema()
+    }
+}
 
 class MetadataGenerator:
     """Document metadata generation using deterministic AI processing."""
     
     MODEL = "gpt-4o-2024-08-06"
     TEMPERATURE = 0.0
+    MAX_TOKENS = 1000  # Both responses are a handful of short text fields
     
     def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = OPENAI_CLIENT
     
     def generate_metadata(self, title: str, content: Optional[str] = None) -> DocumentMetadata:
         """Generate core document metadata from title and content (Step 1)."""
@@ -37,23 +60,16 @@ class MetadataGenerator:
             response = self.client.chat.completions.create(
                 model=self.MODEL,
                 messages=[
-                    {"role": "system", "content": "You are a medical documentation expert."},
+                    _METADATA_SYSTEM_MESSAGE,
                     {"role": "user", "content": prompt}
                 ],
-                response_format={
-                    "type": "json_schema", 
-                    "json_schema": {
-                        "name": "document_metadata",
-                        "strict": True,
-                        "schema": DocumentMetadata.model_json_schema()
-                    }
-                },
+                response_format=_METADATA_RESPONSE_FORMAT,
                 temperature=self.TEMPERATURE,
-                top_p=1.0
+                top_p=1.0,
+                max_tokens=self.MAX_TOKENS
             )
             
-            result_json = json.loads(response.choices[0].message.content)
-            return DocumentMetadata(**result_json)
+            return DocumentMetadata.model_validate_json(response.choices[0].message.content)
             
         except Exception:
             return DocumentMetadata(
@@ -87,23 +103,16 @@ class MetadataGenerator:
             response = self.client.chat.completions.create(
                 model=self.MODEL,
                 messages=[
-                    {"role": "system", "content": "You are a medical terminology enhancement expert."},
+                    _TERMINOLOGY_SYSTEM_MESSAGE,
                     {"role": "user", "content": prompt}
                 ],
-                response_format={
-                    "type": "json_schema", 
-                    "json_schema": {
-                        "name": "enhanced_terminology",
-                        "strict": True,
-                        "schema": EnhancedTerminology.model_json_schema()
-                    }
-                },
+                response_format=_TERMINOLOGY_RESPONSE_FORMAT,
                 temperature=self.TEMPERATURE,
-                top_p=1.0
+                top_p=1.0,
+                max_tokens=self.MAX_TOKENS
             )
             
-            result_json = json.loads(response.choices[0].message.content)
-            return EnhancedTerminology(**result_json)
+            return EnhancedTerminology.model_validate_json(response.choices[0].message.content)
             
         except Exception:
             return EnhancedTerminology(
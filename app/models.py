@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 
 
 class InitialSelectionResponse(BaseModel):
@@ -34,6 +34,23 @@ class ClinicalRefinementResponse(BaseModel):
     )
 
 
+class CPTCode(BaseModel):
+    """Single CPT code extracted from a document"""
+    model_config = ConfigDict(extra='forbid')
+    
+    code: str = Field(description="The CPT code")
+    description: str = Field(description="Brief procedure description")
+    confidence: Literal["High", "Medium", "Low"] = Field(description="Confidence level")
+    supporting_text: str = Field(description="Relevant text from the document that supports this code")
+
+
+class CPTCodeList(BaseModel):
+    """CPT code generation response"""
+    model_config = ConfigDict(extra='forbid')
+    
+    codes: List[CPTCode] = Field(description="Relevant CPT codes, most relevant first")
+
+
 class DocumentMetadata(BaseModel):
     """AI Document Metadata Generation Response - Step 1: Core Metadata"""
     model_config = ConfigDict(extra='forbid')
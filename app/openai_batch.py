@@ -0,0 +1,68 @@
+"""Shared OpenAI Batch API runner for offline chat completion jobs."""
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+import orjson
+from openai import AsyncOpenAI
+
+# Configure professional logging
+logger = logging.getLogger(__name__)
+
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INTERVAL = 30  # Seconds between Batch API status checks
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+async def run_chat_batch(client: AsyncOpenAI, bodies: Dict[str, Dict[str, Any]], name: str) -> Dict[str, str]:
+    """Run chat completion request bodies, keyed by custom_id, as one Batch API job.
+
+    Returns the message content of every request that produced one. Batch jobs
+    are billed at half price but may take up to BATCH_COMPLETION_WINDOW, so
+    this is meant for bulk back-coding rather than interactive requests.
+    Submission errors propagate; a batch that ends without completing yields {}.
+    """
+    request_lines = [
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body
+        })
+        for custom_id, body in bodies.items()
+    ]
+
+    batch_input = await client.files.create(
+        file=(f"{name}_batch.jsonl", b"\n".join(request_lines)),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_input.id,
+        endpoint="/v1/chat/completions",
+        completion_window=BATCH_COMPLETION_WINDOW
+    )
+    logger.info(f"Submitted {name} batch {batch.id} with {len(request_lines)} requests")
+
+    while batch.status not in BATCH_TERMINAL_STATUSES:
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        batch = await client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        logger.error(f"{name} batch {batch.id} finished with status: {batch.status}")
+        return {}
+
+    batch_output = await client.files.content(batch.output_file_id)
+
+    # Parse output lines as bytes; orjson validates without a str decode
+    contents = {}
+    for line in batch_output.content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+            contents[record["custom_id"]] = record["response"]["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.warning(f"Skipping unparseable {name} batch result: {e}")
+
+    return contents
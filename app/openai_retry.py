@@ -0,0 +1,62 @@
+"""Shared retry policy for async OpenAI chat completion calls."""
+
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from openai import AsyncOpenAI, RateLimitError, APITimeoutError, APIConnectionError
+
+from .config import OPENAI_SEMAPHORE
+
+# Configure professional logging
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0  # Seconds, doubled on every retry
+RETRY_MAX_DELAY = 30.0
+
+# Transient failures worth retrying; auth and request errors are raised immediately.
+# Streams surface mid-response disconnects and read timeouts as raw httpx transport errors
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, httpx.TransportError)
+
+T = TypeVar("T")
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Return the server's Retry-After hint in seconds, if the error carries one."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+async def create_with_backoff(client: AsyncOpenAI, request: Dict[str, Any]) -> Any:
+    """Create a chat completion under the shared concurrency limit, retrying transient
+    failures with jittered exponential backoff (or the server's Retry-After hint)."""
+    return await with_backoff(lambda: client.chat.completions.create(**request))
+
+
+async def with_backoff(operation: Callable[[], Awaitable[T]]) -> T:
+    """Run an OpenAI operation under the shared concurrency limit with the same retry policy.
+
+    The semaphore is held for the whole operation, so a streamed response counts
+    against the limit until it has been consumed, and a failure mid-stream retries
+    from the start.
+    """
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            async with OPENAI_SEMAPHORE:
+                return await operation()
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            logger.warning(f"OpenAI call failed ({type(e).__name__}), retry {attempt}/{MAX_RETRIES - 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
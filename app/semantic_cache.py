@@ -0,0 +1,82 @@
+"""In-process semantic cache keyed by document embedding similarity."""
+
+import copy
+import logging
+import os
+import threading
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+
+# Configure professional logging
+logger = logging.getLogger(__name__)
+
+# Opt-in: near-duplicate documents can still differ in codable detail (laterality, episode)
+ENABLE_SEMANTIC_CACHE = os.getenv("ENABLE_SEMANTIC_CACHE") == "1"
+
+
+class SemanticCache:
+    """Return a stored result when a new embedding is within a cosine threshold of a cached one."""
+
+    SIMILARITY_THRESHOLD = 0.98
+    MAX_ENTRIES = 2048
+    TTL = 24 * 3600  # Seconds an entry stays valid
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_entries: int = MAX_ENTRIES, ttl: float = TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None  # Unit-normalized rows, one per entry
+        self._values: List[Any] = []
+        self._expires_at: List[float] = []
+
+    def get(self, embedding: List[float]) -> Optional[Any]:
+        """Return a copy of the value stored for the most similar embedding, or None below the threshold."""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._drop_expired()
+            if self._vectors is None:
+                return None
+            similarities = self._vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            logger.info(f"Semantic cache hit (similarity {similarities[best]:.4f})")
+            # Callers may mutate the result; the cached value must stay intact
+            return copy.deepcopy(self._values[best])
+    
+    def set(self, embedding: List[float], value: Any) -> None:
+        """Store a copy of value under embedding, evicting the oldest entries when full."""
+        row = self._normalize(embedding)[np.newaxis, :]
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._drop_expired()
+            if self._vectors is None:
+                self._vectors = row
+            else:
+                # Positive start index: a negative slice of -0 would keep every entry
+                start = max(0, len(self._values) - (self.max_entries - 1))
+                self._vectors = np.vstack((self._vectors[start:], row))
+                self._values = self._values[start:]
+                self._expires_at = self._expires_at[start:]
+            self._values.append(value)
+            self._expires_at.append(time.time() + self.ttl)
+    
+    def _drop_expired(self) -> None:
+        """Remove expired entries so they neither match nor take slots; call under the lock."""
+        now = time.time()
+        if not self._expires_at or self._expires_at[0] >= now:
+            return
+        # Every entry shares one TTL, so insertion order is expiry order
+        live = next((index for index, expires_at in enumerate(self._expires_at) if expires_at >= now), len(self._expires_at))
+        self._values = self._values[live:]
+        self._expires_at = self._expires_at[live:]
+        self._vectors = self._vectors[live:] if self._values else None
+    
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        """Scale an embedding to unit length so a dot product is cosine similarity."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,50 @@
+"""Shared tiktoken helpers for keeping model inputs within token limits."""
+
+import functools
+import logging
+from typing import Any, Optional, Tuple
+
+# Configure professional logging
+logger = logging.getLogger(__name__)
+
+
+# Text is cut to this many characters per allowed token before encoding; tokens average
+# about 4 characters, so the slice keeps every fitting token while bounding encode cost
+MAX_CHARS_PER_TOKEN = 6
+
+
+@functools.cache
+def get_encoding(name: str) -> Optional[Any]:
+    """Return the named tiktoken encoding, or None when it cannot be loaded.
+
+    tiktoken downloads its BPE file on first use; a failed load is cached as None
+    (truncate by characters) rather than retried and raised on every call. Call
+    once from a worker thread at startup so the download never runs on the event loop.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken not installed; truncating model inputs by character count")
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding {name}; truncating model inputs by character count: {e}")
+        return None
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str, max_chars: int) -> Tuple[str, Optional[int]]:
+    """Limit text to max_tokens, or to max_chars without a tokenizer.
+
+    Returns the (possibly truncated) text with its token count, or None for the
+    count when no tokenizer is available.
+    """
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return text[:max_chars], None
+
+    text = text[:max_tokens * MAX_CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return encoding.decode(tokens[:max_tokens]), max_tokens
@@ -1,11 +1,14 @@
 """Clean vector search operations with official validation and deterministic ordering."""
 
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional, Tuple
+from operator import itemgetter
 from pinecone import Pinecone
-from openai import OpenAI
 import simple_icd_10_cm as icd_lib
-from .config import PINECONE_API_KEY, PINECONE_INDEX_NAME, OPENAI_API_KEY
+from .config import PINECONE_API_KEY, PINECONE_INDEX_NAME, OPENAI_CLIENT
+from .token_limits import get_encoding, truncate_to_tokens
+import asyncio
 import logging
+import sys
 
 # Configure professional logging
 logger = logging.getLogger(__name__)
@@ -16,23 +19,48 @@ class VectorSearchEngine:
     MAX_CANDIDATES = 150
     EMBEDDING_MODEL = "text-embedding-3-small"
     MINIMUM_SCORE_THRESHOLD = 0.1  # Filter very low relevance results
+    RICH_TEXT_PREVIEW_CHARS = 200  # Clinical context length shown to the selection model
+    EMBEDDING_ENCODING = "cl100k_base"  # Tokenizer used by text-embedding-3 models
+    EMBEDDING_MAX_TOKENS = 8191  # Per-input limit of the embeddings API
+    EMBEDDING_MAX_CHARS = 16000  # Per-input cap when no tokenizer is available
+    EMBEDDING_BATCH_TOKENS = 250_000  # Tokens per embeddings request, under the API's 300k cap
+    EMBEDDING_BATCH_MAX_INPUTS = 2048  # Inputs per embeddings request (API limit)
     
     def __init__(self):
         self.pc = Pinecone(api_key=PINECONE_API_KEY)
         self.index = self.pc.Index(PINECONE_INDEX_NAME)
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        self.openai_client = OPENAI_CLIENT
+        # Load the tokenizer now (built off the event loop at startup) rather than on the first request
+        get_encoding(self.EMBEDDING_ENCODING)
         logger.info(f"Vector search engine initialized with model: {self.EMBEDDING_MODEL}")
     
-    async def search_codes(self, search_text: str) -> List[Dict]:
-        """Search for candidate codes with official validation and deterministic ordering."""
+    async def embed_text(self, text: str) -> List[float]:
+        """Create an embedding without blocking the event loop."""
+        return await asyncio.to_thread(self._create_embedding, text)
+    
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Create embeddings for many texts in batched requests without blocking the event loop."""
+        return await asyncio.to_thread(self._create_embeddings, texts)
+    
+    async def search_codes(self, search_text: str, embedding: Optional[List[float]] = None) -> List[Dict]:
+        """Search for candidate codes with official validation and deterministic ordering.
+        
+        Each candidate dict carries: icd_code, score, description, rich_text,
+        rich_text_short (rich_text truncated once for prompt formatting),
+        chapter and section. Pass a precomputed embedding of search_text to
+        skip creating it again.
+        """
         
         logger.info(f"Executing vector search for text: {search_text[:100]}...")
         
-        # Create embedding
-        embedding = self._create_embedding(search_text)
+        # Embedding and Pinecone clients are blocking; run them off the event loop
+        # so concurrent documents' LLM calls keep draining during the round trips
+        if embedding is None:
+            embedding = await self.embed_text(search_text)
         
         # Vector search with expanded results
-        search_result = self.index.query(
+        search_result = await asyncio.to_thread(
+            self.index.query,
             vector=embedding,
             top_k=self.MAX_CANDIDATES,
             include_metadata=True
@@ -57,13 +85,16 @@ class VectorSearchEngine:
             # Official ICD validation
             if icd_lib.is_valid_item(code):
                 try:
+                    rich_text = match.metadata.get('text', '')  # Fixed: retrieve from 'text' key
                     validated_candidates.append({
                         'icd_code': code,
                         'score': score,
                         'description': icd_lib.get_description(code),
-                        'rich_text': match.metadata.get('text', ''),  # Fixed: retrieve from 'text' key
-                        'chapter': match.metadata.get('chapter', ''),
-                        'section': match.metadata.get('section', '')
+                        'rich_text': rich_text,
+                        'rich_text_short': rich_text[:self.RICH_TEXT_PREVIEW_CHARS],
+                        # Chapter/section labels repeat across matches; intern so candidates share one copy
+                        'chapter': sys.intern(match.metadata.get('chapter', '')),
+                        'section': sys.intern(match.metadata.get('section', ''))
                     })
                 except Exception as e:
                     logger.warning(f"Error processing valid code {code}: {e}")
@@ -94,18 +125,19 @@ class VectorSearchEngine:
     
     def _ensure_deterministic_ordering(self, candidates: List[Dict]) -> List[Dict]:
         """Ensure consistent ordering for deterministic results across runs."""
-        # Sort by score (descending) then by ICD code (ascending) for tie-breaking
-        sorted_candidates = sorted(candidates, key=lambda x: x['icd_code'])
+        # Sort by ICD code only: float scores can jitter between runs, codes cannot.
+        # In-place sort with a C-level key avoids a copy and per-item lambda frames.
+        candidates.sort(key=itemgetter('icd_code'))
         
         logger.debug(f"Applied deterministic ordering to {len(candidates)} candidates")
-        return sorted_candidates
+        return candidates
     
     def _create_embedding(self, text: str) -> List[float]:
         """Create embedding for text using OpenAI with error handling."""
         try:
             response = self.openai_client.embeddings.create(
                 model=self.EMBEDDING_MODEL,
-                input=text.strip()
+                input=self._prepare_input(text)[0]
             )
             embedding = response.data[0].embedding
             logger.debug(f"Created embedding for text length: {len(text)} chars")
@@ -113,4 +145,43 @@ class VectorSearchEngine:
             
         except Exception as e:
             logger.error(f"Embedding creation failed: {e}")
-            raise RuntimeError(f"Failed to create embedding: {e}") 
\ No newline at end of file
+            raise RuntimeError(f"Failed to create embedding: {e}") 
+    
+    def _create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Create embeddings for texts, packing inputs into requests by token budget."""
+        embeddings = []
+        try:
+            for batch in self._token_batches(texts):
+                response = self.openai_client.embeddings.create(
+                    model=self.EMBEDDING_MODEL,
+                    input=batch
+                )
+                # Results carry their input index; order by it rather than trusting response order
+                embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+            logger.debug(f"Created {len(embeddings)} embeddings in batched requests")
+            return embeddings
+            
+        except Exception as e:
+            logger.error(f"Batch embedding creation failed: {e}")
+            raise RuntimeError(f"Failed to create embeddings: {e}")
+    
+    def _token_batches(self, texts: List[str]) -> Iterator[List[str]]:
+        """Group prepared inputs into requests within EMBEDDING_BATCH_TOKENS and EMBEDDING_BATCH_MAX_INPUTS."""
+        batch, batch_tokens = [], 0
+        for text in texts:
+            text, tokens = self._prepare_input(text)
+            if batch and (batch_tokens + tokens > self.EMBEDDING_BATCH_TOKENS or len(batch) == self.EMBEDDING_BATCH_MAX_INPUTS):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+    
+    def _prepare_input(self, text: str) -> Tuple[str, int]:
+        """Strip and truncate one input to EMBEDDING_MAX_TOKENS, returning it with its token count."""
+        text, tokens = truncate_to_tokens(
+            text.strip(), self.EMBEDDING_MAX_TOKENS, self.EMBEDDING_ENCODING, self.EMBEDDING_MAX_CHARS
+        )
+        # Without a tokenizer the character count is an upper bound on the token count
+        return text, tokens if tokens is not None else len(text)
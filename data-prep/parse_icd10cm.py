@@ -6,6 +6,20 @@ from dataclasses import dataclass, asdict
 import argparse
 from pathlib import Path
 
+# Patterns applied per code; compiled once for the ~46k-code parse
+ORDER_LINE_RE = re.compile(r'^\d+\s+([A-Z0-9\.]+)\s+\d\s+(.+)$')
+CHAPTER_RANGE_RE = re.compile(r'\(([A-Z0-9\-]+)\)')
+PARENTHETICAL_RE = re.compile(r'\([^)]*\)')
+EMBEDDED_CODE_RE = re.compile(r'[A-Z]\d+[\.\-][A-Z0-9\.\-]*')
+SPECIAL_CHARS_RE = re.compile(r'[^\w\s-]')
+
+KEYWORD_STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 
+    'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 
+    'to', 'was', 'were', 'will', 'with', 'not', 'or', 'due', 'see',
+    'nec', 'nos', 'unspecified', 'other', 'certain', 'diseases'
+})
+
 
 @dataclass
 class ICDCode:
@@ -117,9 +131,9 @@ class ICD10CMParser:
             if not chapter_info:
                 continue
                 
-                section_info = self._extract_section_info(section_elem)
-                
-                for diag_elem in section_elem.findall('diag'):
+            section_info = self._extract_section_info(section_elem)
+            
+            for diag_elem in section_elem.findall('diag'):
                 self._parse_diagnosis_xml(diag_elem, chapter_info, section_info)
 
     def _parse_diagnosis_xml(self, diag_elem: ET.Element, chapter_info: Dict, section_info: Dict, parent_codes: Optional[List[str]] = None):
@@ -182,7 +196,7 @@ class ICD10CMParser:
         
         with open(order_file_path, 'r') as f:
             for line in f:
-                match = re.match(r'^\d+\s+([A-Z0-9\.]+)\s+\d\s+(.+)$', line)
+                match = ORDER_LINE_RE.match(line)
                 if not match:
                     continue
                     
@@ -256,7 +270,7 @@ class ICD10CMParser:
         desc_elem = chapter_elem.find('desc')
         chapter_name = desc_elem.text.strip() if desc_elem is not None else ""
         # Extract range from description, e.g., (A00-B99)
-        range_match = re.search(r'\(([A-Z0-9\-]+)\)', chapter_name)
+        range_match = CHAPTER_RANGE_RE.search(chapter_name)
 
         return {
             'number': int(name_elem.text.strip()) if name_elem is not None and name_elem.text.strip().isdigit() else None,
@@ -318,24 +332,17 @@ class ICD10CMParser:
             return set()
             
         # Clean text - remove parentheses content, codes, and special characters
-        cleaned = re.sub(r'\([^)]*\)', '', text)  # Remove parentheses
-        cleaned = re.sub(r'[A-Z]\d+[\.\-][A-Z0-9\.\-]*', '', cleaned)  # Remove codes
-        cleaned = re.sub(r'[^\w\s-]', '', cleaned)  # Remove special chars
+        cleaned = PARENTHETICAL_RE.sub('', text)  # Remove parentheses
+        cleaned = EMBEDDED_CODE_RE.sub('', cleaned)  # Remove codes
+        cleaned = SPECIAL_CHARS_RE.sub('', cleaned)  # Remove special chars
         
         # Split into words and filter
         words = cleaned.lower().split()
         
         # Filter out common stop words and short words
-        stop_words = {
-            'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 
-            'has', 'he', 'in', 'is', 'it', 'its', 'of', 'on', 'that', 'the', 
-            'to', 'was', 'were', 'will', 'with', 'not', 'or', 'due', 'see',
-            'nec', 'nos', 'unspecified', 'other', 'certain', 'diseases'
-        }
-        
         keywords = {
             word for word in words 
-            if len(word) >= 3 and word not in stop_words and word.isalpha()
+            if len(word) >= 3 and word not in KEYWORD_STOP_WORDS and word.isalpha()
         }
         
         return keywords
@@ -0,0 +1,25 @@
+"""Regression tests for document text extraction."""
+
+from app.document_reader import extract_first_page_content, extract_text_from_file
+
+# XHTML export with an XML encoding declaration, as produced by some patient-education tools
+XHTML_WITH_DECLARATION = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE html>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml">'
+    '<head><title>Asthma</title><script>track()</script></head>'
+    '<body><h1>Asthma café</h1><p>Use your inhaler – daily.</p><h2>More</h2><p>Later section</p></body>'
+    '</html>'
+).encode('utf-8')
+
+
+def test_html_with_xml_encoding_declaration_extracts_full_text():
+    text = extract_text_from_file(XHTML_WITH_DECLARATION, 'asthma.html')
+
+    assert text == 'Asthma Asthma café Use your inhaler – daily. More Later section'
+
+
+def test_html_with_xml_encoding_declaration_extracts_first_section():
+    text = extract_first_page_content(XHTML_WITH_DECLARATION, 'asthma.html')
+
+    assert text == 'Asthma café\nUse your inhaler – daily.'